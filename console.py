@@ -1,17 +1,26 @@
 import os
+import re
 
 from Qt import QtWidgets, QtGui, QtCore
 
-from widgets.output import OutputConsole
+from widgets.output import OutputConsole, SpooledOutputConsole
 from widgets.input import InputConsole
+from widgets.scheduler import QueuePanel
+from widgets.stream import FDCapture
 
 
 class ConsoleDialog(QtWidgets.QDialog):
     def __init__(self, _locals=None, *args, **kwargs):
+        spool_output = kwargs.pop("spool_output", False)
+        subinterpreter = kwargs.pop("subinterpreter", False)
+        kernel_executable = kwargs.pop("kernel_executable", None)
         super(ConsoleDialog, self).__init__(*args, **kwargs)
 
         # create widgets
-        self.console_widget = ConsoleWidget(parent=self, _locals=_locals)
+        self.console_widget = ConsoleWidget(
+            parent=self, _locals=_locals, spool_output=spool_output, subinterpreter=subinterpreter,
+            kernel_executable=kernel_executable,
+        )
 
         # create layouts
         self.top_layout = QtWidgets.QVBoxLayout(self)
@@ -28,6 +37,9 @@ class ConsoleDialog(QtWidgets.QDialog):
 
 class ConsoleWidget(QtWidgets.QWidget):
     def __init__(self, _locals=None, *args, **kwargs):
+        spool_output = kwargs.pop("spool_output", False)
+        subinterpreter = kwargs.pop("subinterpreter", False)
+        kernel_executable = kwargs.pop("kernel_executable", None)
         super(ConsoleWidget, self).__init__(*args, **kwargs)
         self.decorate_application()
 
@@ -36,14 +48,29 @@ class ConsoleWidget(QtWidgets.QWidget):
 
         # create widgets
         self.clear_button = QtWidgets.QPushButton("Clear")
-        self.output_console = OutputConsole()
+        self.stop_button = QtWidgets.QPushButton("Stop")
+        self.background_check = QtWidgets.QCheckBox("Run in Background")
+        self.pump_check = QtWidgets.QCheckBox("Keep UI Alive")
+        self.kernel_check = QtWidgets.QCheckBox("Use Kernel Process")
+        self.subinterpreter_check = QtWidgets.QCheckBox("Sub-interpreter")
+        self.filter_edit = QtWidgets.QLineEdit()
+        self.filter_regex = QtWidgets.QCheckBox("Regex")
+        self.status_label = QtWidgets.QLabel()
+        if spool_output:
+            self.output_console = SpooledOutputConsole()
+        else:
+            self.output_console = OutputConsole()
         self.locals = _locals
         self.input_console = InputConsole(
             appname="Python Terminal",
             stdout=self.output_console.stdin,
             parent=self,
+            kernel_executable=kernel_executable,
         )
 
+        self.queue_panel = QueuePanel(self.input_console.queue)
+        self.fd_capture = FDCapture(self.output_console.stdin, parent=self)
+
         # create layouts
         self.top_layout = QtWidgets.QVBoxLayout(self)
 
@@ -54,10 +81,19 @@ class ConsoleWidget(QtWidgets.QWidget):
         self.button_box = QtWidgets.QWidget()
         self.button_box.setSizePolicy(self.button_box.sizePolicy().horizontalPolicy(), QtWidgets.QSizePolicy.Fixed)
         self.button_box.setLayout(QtWidgets.QHBoxLayout())
+        self.button_box.layout().addWidget(self.filter_edit)
+        self.button_box.layout().addWidget(self.filter_regex)
         self.button_box.layout().addStretch(1)
+        self.button_box.layout().addWidget(self.status_label)
+        self.button_box.layout().addWidget(self.background_check)
+        self.button_box.layout().addWidget(self.pump_check)
+        self.button_box.layout().addWidget(self.kernel_check)
+        self.button_box.layout().addWidget(self.subinterpreter_check)
+        self.button_box.layout().addWidget(self.stop_button)
         self.button_box.layout().addWidget(self.clear_button)
 
         self.top_layout.addWidget(self.splitter)
+        self.top_layout.addWidget(self.queue_panel)
         self.top_layout.addWidget(self.button_box)
 
         # set properties
@@ -65,11 +101,35 @@ class ConsoleWidget(QtWidgets.QWidget):
         self.button_box.setContentsMargins(0, 0, 0, 0)
         self.button_box.layout().setContentsMargins(0, 0, 0, 0)
         self.button_box.layout().setSpacing(0)
+        self.filter_edit.setPlaceholderText("Filter output...")
+        self.filter_edit.setMaximumWidth(300)
+        self.stop_button.setEnabled(False)
+        if not self.input_console.subinterpretersAvailable():
+            self.subinterpreter_check.setEnabled(False)
+            self.subinterpreter_check.setToolTip("Sub-interpreters need Python 3.14 or newer")
 
         # connect signals
         self.input_console.CODE_EXECUTED.connect(self.output_console.read_stdin)
-        self.input_console.clear_output.connect(self.output_console.clear)
-        self.clear_button.clicked.connect(self.output_console.clear)
+        self.input_console.clear_output.connect(self.clear_console)
+        self.clear_button.clicked.connect(self.clear_console)
+        self.filter_edit.textChanged.connect(self.filter_output)
+        self.filter_regex.toggled.connect(self.filter_output)
+        self.output_console.stdin.statsChanged.connect(self.update_status)
+        self.input_console.EXECUTION_STARTED.connect(self.execution_started)
+        self.input_console.CODE_EXECUTED.connect(self.execution_finished)
+        self.stop_button.clicked.connect(self.input_console.cancelExecution)
+        self.background_check.toggled.connect(self.set_threaded)
+        self.pump_check.toggled.connect(self.set_pump_events)
+        self.kernel_check.toggled.connect(self.set_use_kernel)
+        self.subinterpreter_check.toggled.connect(self.set_use_subinterpreter)
+        self.destroyed.connect(self.fd_capture.stop)
+        self.destroyed.connect(self.input_console.kernel.kill)
+        if self.input_console.subinterpreter is not None:
+            self.destroyed.connect(self.input_console.subinterpreter.shutdown)
+        if self.input_console.event_loop is not None:
+            self.destroyed.connect(self.input_console.event_loop.close)
+
+        self.subinterpreter_check.setChecked(subinterpreter and self.input_console.subinterpretersAvailable())
 
         # self.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         # self.customContextMenuRequested.connect()
@@ -109,6 +169,14 @@ class ConsoleWidget(QtWidgets.QWidget):
         menu = QtWidgets.QMenu("ContextMenu")
         menu.addSeparator()
         menu.addAction("Rotate...", self.rotate_splitter)
+        capture = menu.addAction("Capture C Output")
+        capture.setCheckable(True)
+        capture.setChecked(self.fd_capture.active)
+        capture.toggled.connect(self.set_fd_capture)
+        restart = menu.addAction("Restart Kernel", self.restart_kernel)
+        restart.setEnabled(self.input_console.use_kernel)
+        fetch = menu.addAction("Fetch from Kernel...", self.fetch_from_kernel)
+        fetch.setEnabled(self.input_console.kernel.alive)
         return menu
 
     def contextMenuEvent(self, event):
@@ -133,9 +201,106 @@ class ConsoleWidget(QtWidgets.QWidget):
             e.accept()
             return
 
+    @QtCore.Slot(bool)
+    def set_fd_capture(self, enabled):
+        if not enabled:
+            self.fd_capture.stop()
+            return
+        try:
+            self.fd_capture.start()
+        except OSError as err:
+            self.output_console.appendOutput("Unable to capture C output: %s\n" % err, "stderr")
+
+    @QtCore.Slot()
+    def execution_started(self):
+        console = self.input_console
+        if console.session is not None:
+            self.stop_button.setEnabled(console.session is console.kernel)
+        else:
+            self.stop_button.setEnabled(console.awaiting or console.threaded or console.pump_events)
+
+    @QtCore.Slot()
+    def execution_finished(self):
+        self.stop_button.setEnabled(False)
+        self.update_status()
+
+    @QtCore.Slot(bool)
+    def set_threaded(self, enabled):
+        self.input_console.threaded = enabled
+
+    @QtCore.Slot(bool)
+    def set_pump_events(self, enabled):
+        self.input_console.pump_events = enabled
+
+    @QtCore.Slot(bool)
+    def set_use_kernel(self, enabled):
+        self.input_console.use_kernel = enabled
+        if enabled:
+            self.subinterpreter_check.setChecked(False)
+        self.update_session_options()
+
+    @QtCore.Slot(bool)
+    def set_use_subinterpreter(self, enabled):
+        self.input_console.use_subinterpreter = enabled
+        if enabled:
+            self.kernel_check.setChecked(False)
+        self.update_session_options()
+
+    def update_session_options(self):
+        # The in-process options don't apply to code running elsewhere.
+        in_process = self.input_console.session is None
+        self.background_check.setEnabled(in_process)
+        self.pump_check.setEnabled(in_process)
+
+    @QtCore.Slot()
+    def restart_kernel(self):
+        try:
+            self.input_console.restartKernel()
+        except (OSError, RuntimeError) as err:
+            self.output_console.appendOutput("Unable to restart the kernel: %s\n" % err, "stderr")
+
+    @QtCore.Slot()
+    def fetch_from_kernel(self):
+        text, accepted = QtWidgets.QInputDialog.getText(
+            self, "Fetch from Kernel", "Names to copy into the console (comma separated):", text="_"
+        )
+        names = [name.strip() for name in text.split(",") if name.strip()]
+        if not accepted or not names:
+            return
+        try:
+            values = self.input_console.fetchFromKernel(names)
+        except (OSError, RuntimeError) as err:
+            self.output_console.appendOutput("Unable to fetch from the kernel: %s\n" % err, "stderr")
+            return
+        self.output_console.appendOutput("Fetched %s from the kernel.\n" % ", ".join(sorted(values)))
+
+    @QtCore.Slot()
+    def update_status(self):
+        router = self.output_console.stdin
+        messages = []
+        if router.collapsed_lines:
+            messages.append("%d repeated lines collapsed" % router.collapsed_lines)
+        if router.dropped_chars:
+            messages.append("%d characters dropped" % router.dropped_chars)
+        if self.input_console.pump_events and self.input_console.pump.calls:
+            messages.append(self.input_console.pump.summary())
+        self.status_label.setText(", ".join(messages))
+
+    @QtCore.Slot()
+    def filter_output(self):
+        try:
+            self.output_console.setFilter(self.filter_edit.text(), regex=self.filter_regex.isChecked())
+        except re.error as err:
+            self.filter_edit.setStyleSheet("color: red;")
+            self.filter_edit.setToolTip(str(err))
+        else:
+            self.filter_edit.setStyleSheet("")
+            self.filter_edit.setToolTip("")
+
     @QtCore.Slot()
     def clear_console(self):
         self.output_console.clear()
+        self.output_console.stdin.resetStats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+# The widgets package is imported from the repository root, like console.py does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _BoundSignal(object):
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot, *args):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in list(self.slots):
+            slot(*args)
+
+
+class _Signal(object):
+    def __init__(self, *types):
+        pass
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__.setdefault(id(self), _BoundSignal())
+
+
+class _QObject(object):
+    _thread = object()
+
+    def __init__(self, parent=None):
+        pass
+
+    def thread(self):
+        return self._thread
+
+
+class _QTimer(_QObject):
+    timeout = _Signal()
+
+    def __init__(self, parent=None):
+        self.active = False
+
+    def setInterval(self, interval):
+        pass
+
+    def start(self):
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def isActive(self):
+        return self.active
+
+
+def _qt_core():
+    """Just enough of QtCore for OutputRouter, everything runs on one "GUI" thread."""
+    core = types.ModuleType("QtCore")
+    core.QObject = _QObject
+    core.QTimer = _QTimer
+    core.Signal = _Signal
+    core.QThread = types.SimpleNamespace(currentThread=lambda: _QObject._thread)
+    core.QCoreApplication = types.SimpleNamespace(processEvents=lambda *args: None)
+    core.QEventLoop = types.SimpleNamespace(ExcludeUserInputEvents=0)
+    return core
+
+
+@pytest.fixture
+def qt_import(monkeypatch):
+    """Import widgets modules that only need QtCore, with a stand-in when no Qt binding is installed."""
+    try:
+        importlib.import_module("Qt")
+    except ImportError:
+        qt = types.ModuleType("Qt")
+        qt.QtCore = _qt_core()
+        monkeypatch.setitem(sys.modules, "Qt", qt)
+        for name in list(sys.modules):
+            if name.startswith("widgets."):
+                monkeypatch.delitem(sys.modules, name)
+    return importlib.import_module
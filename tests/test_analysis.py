@@ -0,0 +1,30 @@
+import ast
+
+from widgets.analysis import bound_names, free_names, used_names
+
+
+def test_bound_names_skip_function_locals():
+    tree = ast.parse(
+        "import os.path\n"
+        "from json import loads as parse\n"
+        "def f(a):\n"
+        "    local = a\n"
+        "    global g\n"
+        "x, y = 1, 2\n"
+    )
+    assert bound_names(tree) == set(["os", "parse", "f", "g", "x", "y"])
+
+
+def test_used_names_include_augmented_targets():
+    assert used_names(ast.parse("total += value")) == set(["total", "value"])
+
+
+def test_free_names_are_read_before_being_bound():
+    def free(source):
+        return free_names(ast.parse(source))
+    assert free("r = f()\nr") == {"f"}
+    assert free("r\nr = 1") == {"r"}
+    assert free("x = x + 1") == {"x"}
+    # A conditional binding may not happen.
+    assert free("if c:\n    r = 1\nr") == {"c", "r"}
+    assert free("r: int\nr") == {"int", "r"}
@@ -0,0 +1,36 @@
+from widgets.cells import CellTracker, split_cells
+from widgets.compiler import CodeCache
+
+TEXT = "a = 1\n# %% b\nb = a + 1\n# %% c\nc = b\n# %% other\nprint(a)\n"
+
+
+def test_split_on_markers():
+    cells = split_cells(TEXT, len)
+    assert [cell.label() for cell in cells] == ["cell 1", "b", "c", "other"]
+    assert cells[1].line == 2
+    assert cells[1].source == "b = a + 1"
+
+
+def test_changed_until_marked_run():
+    tracker = CellTracker(CodeCache())
+    cell = tracker.cells(TEXT)[1]
+    assert tracker.isChanged(cell)
+    tracker.markRun(cell)
+    assert not tracker.isChanged(cell)
+    assert tracker.isChanged(tracker.cells(TEXT.replace("a + 1", "a + 2"))[1])
+
+
+def test_names_come_from_the_code_cache():
+    cache = CodeCache()
+    tracker = CellTracker(cache)
+    cells = tracker.cells(TEXT + "# %% broken\n)(\n")
+    assert tracker.names(cells[1]) == (frozenset(["b"]), frozenset(["a"]))
+    assert tracker.names(cells[-1]) == (frozenset(), frozenset())
+    assert cache.stats()["hits"] + cache.stats()["misses"] == 2
+
+
+def test_dependents_in_topological_order():
+    tracker = CellTracker(CodeCache())
+    cells = tracker.cells(TEXT)
+    assert [cell.title for cell in tracker.dependents(TEXT, [cells[1]])] == ["b", "c"]
+    assert [cell.index for cell in tracker.dependents(TEXT, [cells[0]])] == [0, 1, 2, 3]
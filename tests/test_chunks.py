@@ -0,0 +1,33 @@
+from widgets.chunks import STDERR, STDOUT, ChunkTable
+
+
+def make_table():
+    table = ChunkTable()
+    table.append(0, "stdout", 1, 0.0)
+    table.append(3, "stderr", 1, 0.0)
+    table.append(5, "stdout", 2, 0.0)
+    return table
+
+
+def test_find_returns_covering_chunk():
+    table = make_table()
+    assert table.find(0) == 0
+    assert table.find(4) == 1
+    assert table.find(9) == 2
+    assert table.stream(3) == STDERR
+    assert table.execution(6) == 2
+
+
+def test_ranges_filter_on_execution_and_stream():
+    table = make_table()
+    assert list(table.ranges(execution=1)) == [(0, 3), (3, 5)]
+    assert list(table.ranges(stream=STDOUT)) == [(0, 3), (5, None)]
+    assert list(table.ranges(execution=3)) == []
+
+
+def test_trim_forgets_chunks_before_the_first_line():
+    table = make_table()
+    table.trim(4)
+    assert len(table) == 2
+    assert table.find(2) == -1
+    assert table.firstLine(1) == 3
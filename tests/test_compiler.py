@@ -0,0 +1,46 @@
+import ast
+
+from widgets.compiler import CodeCache
+
+
+def test_trailing_expression_is_returned():
+    snippet = CodeCache().compile("x = 2\nx * 3")
+    namespace = {}
+    assert snippet.run(namespace) == 6
+    assert namespace["x"] == 2
+    assert snippet.names == frozenset(["x"])
+
+
+def test_compiled_snippets_are_cached():
+    cache = CodeCache(maxsize=1)
+    first = cache.compile("1")
+    assert cache.compile("1") is first
+    cache.compile("2")
+    assert cache.compile("1") is not first
+    assert cache.stats() == {"hits": 1, "misses": 3, "size": 1, "maxsize": 1}
+
+
+class Double(ast.NodeTransformer):
+    def visit_Constant(self, node):
+        return ast.copy_location(ast.Constant(node.value * 2), node)
+
+
+def test_transforms_run_before_compiling():
+    cache = CodeCache()
+    cache.compile("21")
+    cache.addTransform(Double)
+    assert len(cache) == 0
+    assert cache.compile("21").run({}) == 42
+    cache.removeTransform(Double)
+    assert cache.compile("21").run({}) == 21
+
+
+def test_top_level_del_needs_no_rewrite():
+    namespace = {}
+    CodeCache().compile("x = 1\ndel x").run(namespace)
+    assert "x" not in namespace
+
+
+def test_snippets_know_the_names_they_read():
+    snippet = CodeCache().compile("r = f(a)\nr + b")
+    assert snippet.used == {"f", "a", "b"}
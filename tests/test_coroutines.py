@@ -0,0 +1,96 @@
+import contextlib
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 8), reason="top-level await")
+
+
+class Router(object):
+    @contextlib.contextmanager
+    def routed(self):
+        yield self
+
+
+@pytest.fixture
+def loop(qt_import):
+    loop = qt_import("widgets.aio").QtAsyncioLoop(Router())
+    yield loop
+    loop.close()
+
+
+def step_until_idle(loop, limit=100):
+    for _ in range(limit):
+        loop.step()
+        if not loop.pending:
+            return
+    raise AssertionError("tasks still pending")
+
+
+def test_top_level_await_compiles_to_a_coroutine():
+    import asyncio
+    from widgets.compiler import CodeCache
+    from widgets.coroutines import run_async
+
+    snippet = CodeCache().compile("import asyncio\nawait asyncio.sleep(0)\nx = 1\nx + 1")
+    assert snippet.is_async
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(run_async(snippet, {})) == 2
+    finally:
+        loop.close()
+
+
+def test_done_is_called_once_the_task_finishes(loop):
+    calls = []
+
+    async def work():
+        import asyncio
+        await asyncio.sleep(0)
+        return 42
+
+    loop.run(work(), lambda *args: calls.append(args))
+    step_until_idle(loop)
+    loop.step()
+    assert calls == [(42, None, False)]
+
+
+def test_errors_are_passed_to_done(loop):
+    calls = []
+
+    async def work():
+        raise ValueError("boom")
+
+    loop.run(work(), lambda *args: calls.append(args))
+    step_until_idle(loop)
+    assert len(calls) == 1
+    assert isinstance(calls[0][1], ValueError)
+
+
+def test_task_cancelled_before_its_first_step_is_reported(loop):
+    calls = []
+
+    async def work():
+        return 1
+
+    task = loop.run(work(), lambda *args: calls.append(args))
+    task.cancel()
+    step_until_idle(loop)
+    loop.step()
+    assert task.cancelled()
+    assert calls == [(None, None, True)]
+
+
+def test_cancel_all_reports_running_tasks(loop):
+    calls = []
+
+    async def work():
+        import asyncio
+        await asyncio.sleep(60)
+
+    loop.run(work(), lambda *args: calls.append(args))
+    loop.step()
+    loop.cancelAll()
+    step_until_idle(loop)
+    loop.step()
+    assert calls == [(None, None, True)]
@@ -0,0 +1,38 @@
+import threading
+import time
+
+
+def run(executor, function):
+    calls = []
+    finished = threading.Event()
+
+    def on_finished(error):
+        calls.append((executor.running, error))
+        finished.set()
+
+    executor.finished.connect(on_finished)
+    executor.execute(function)
+    return calls, finished
+
+
+def test_not_running_once_finished_is_emitted(qt_import):
+    executor = qt_import("widgets.engine").ThreadedExecutor()
+    calls, finished = run(executor, lambda: None)
+    assert finished.wait(5)
+    assert calls == [(False, None)]
+    assert not executor.running
+
+
+def test_cancel_interrupts_the_worker(qt_import):
+    executor = qt_import("widgets.engine").ThreadedExecutor()
+
+    def spin():
+        while True:
+            time.sleep(0.001)
+
+    calls, finished = run(executor, spin)
+    deadline = time.time() + 5
+    while not executor.cancel() and time.time() < deadline:
+        time.sleep(0.01)
+    assert finished.wait(5)
+    assert isinstance(calls[0][1], KeyboardInterrupt)
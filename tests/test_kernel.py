@@ -0,0 +1,120 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from widgets.kernel import KernelClient, default_executable
+
+
+class Recorder(object):
+    def __init__(self):
+        self.output = []
+        self.done = []
+        self._event = threading.Event()
+
+    def on_output(self, name, text):
+        self.output.append((name, text))
+
+    def on_done(self, request, error):
+        self.done.append((request, error))
+        self._event.set()
+
+    def wait(self, timeout=30.0):
+        assert self._event.wait(timeout), "the kernel didn't finish"
+        self._event.clear()
+        return self.done[-1]
+
+    def text(self, name="stdout"):
+        return "".join(text for stream, text in self.output if stream == name)
+
+
+@pytest.fixture
+def kernel():
+    recorder = Recorder()
+    client = KernelClient(recorder.on_output, recorder.on_done, executable=sys.executable)
+    client.recorder = recorder
+    yield client
+    client.kill()
+
+
+def run(kernel, source):
+    request = kernel.execute(source)
+    done = kernel.recorder.wait()
+    assert done[0] == request
+    return done[1]
+
+
+def test_execute_and_fetch(kernel):
+    assert run(kernel, "x = 21 * 2\nprint('value', x)") is None
+    assert kernel.fetch(["x"]) == {"x": 42}
+    assert "ZeroDivisionError" in run(kernel, "1 / 0")
+    with pytest.raises(RuntimeError):
+        kernel.fetch(["missing"])
+    # The output pipes are read on their own threads.
+    deadline = time.time() + 5
+    while "value 42" not in kernel.recorder.text() and time.time() < deadline:
+        time.sleep(0.01)
+    assert "value 42" in kernel.recorder.text()
+
+
+def test_interrupt_stops_running_code(kernel):
+    kernel.execute("import time\nwhile True:\n    time.sleep(0.01)")
+    time.sleep(0.5)
+    assert kernel.interrupt()
+    assert "KeyboardInterrupt" in kernel.recorder.wait()[1]
+    assert kernel.alive
+
+
+def test_crash_and_restart(kernel):
+    run(kernel, "x = 1")
+    assert run(kernel, "import os\nos._exit(3)") is not None
+    assert not kernel.alive
+    # The next execution starts a fresh kernel.
+    assert "NameError" in run(kernel, "x")
+    run(kernel, "x = 2")
+    kernel.restart()
+    assert kernel.alive
+    assert "NameError" in run(kernel, "x")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a shell script as the interpreter")
+def test_unusable_interpreter_fails_fast(tmpdir):
+    recorder = Recorder()
+    script = tmpdir.join("not-python")
+    script.write("#!/bin/sh\nexit 3\n")
+    script.chmod(0o755)
+    client = KernelClient(recorder.on_output, recorder.on_done, executable=str(script))
+    start = time.time()
+    with pytest.raises(RuntimeError) as error:
+        client.start()
+    assert "exited with code 3" in str(error.value)
+    assert time.time() - start < client.startup_timeout
+
+
+def test_default_executable_is_a_python_interpreter():
+    assert default_executable() == sys.executable
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="pickle protocol 5 and shared memory")
+def test_large_buffers_come_back_through_shared_memory(kernel):
+    run(kernel, "data = bytes(range(256)) * 16384\nsmall = b'abc'")
+    values = kernel.fetch(["data", "small"])
+    assert len(values["data"]) == 4 * 1024 * 1024
+    assert values["data"] == bytes(range(256)) * 16384
+    assert values["small"] == b"abc"
+    # The segments stay mapped while the values are alive.
+    assert kernel._segments
+    del values
+    kernel._releaseSegments()
+    assert not kernel._segments
+
+
+def test_numpy_arrays_share_the_segment(kernel):
+    numpy = pytest.importorskip("numpy")
+    run(kernel, "import numpy\narray = numpy.arange(1000000, dtype='float64')")
+    array = kernel.fetch(["array"])["array"]
+    assert array.shape == (1000000,)
+    assert array[-1] == 999999.0
+    assert not array.flags.owndata
+    numpy.testing.assert_array_equal(array[:3], [0.0, 1.0, 2.0])
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from widgets.compiler import CodeCache
+from widgets.memo import MemoCache, fingerprint
+
+
+@pytest.fixture
+def memo(tmpdir):
+    return MemoCache(str(tmpdir.join("memo")))
+
+
+def run(memo, source, namespace):
+    return memo.run(CodeCache().compile(source), source, namespace)
+
+
+def test_functions_change_with_the_globals_they_read():
+    namespace = {}
+    exec("k = 2\ndef g(x):\n    return x * k\ndef f(x):\n    return g(x)", namespace)
+    before = fingerprint(namespace["f"])
+    namespace["k"] = 3
+    assert fingerprint(namespace["f"]) != before
+
+
+def test_functions_change_with_their_defaults():
+    def make(default):
+        def f(x=default):
+            return x
+        return f
+    assert fingerprint(make(1)) != fingerprint(make(2))
+    assert fingerprint(make(1)) == fingerprint(make(1))
+
+
+def test_unpicklable_values_have_no_fingerprint():
+    assert fingerprint(lambda: None) is not None
+    assert fingerprint(open(os.devnull)) is None
+
+
+def test_sets_have_the_same_fingerprint_in_every_process():
+    # String hashing, and with it set order, is seeded per process.
+    script = (
+        "from widgets.memo import fingerprint\n"
+        "words = ['w%d' % index for index in range(50)]\n"
+        "print(fingerprint(({'a': set(words)}, [frozenset(words), frozenset([frozenset(words)])])))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    outputs = set()
+    for seed in ("1", "2", "3"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        outputs.add(subprocess.check_output([sys.executable, "-c", script], cwd=root, env=env))
+    assert len(outputs) == 1
+    assert b"None" not in outputs.pop()
+
+
+def test_sets_and_frozensets_differ():
+    assert fingerprint({"a", "b"}) != fingerprint(frozenset(["a", "b"]))
+    assert fingerprint({"a", "b"}) == fingerprint({"b", "a"})
+    assert fingerprint({"a", open(os.devnull)}) is None
+
+
+def test_second_run_restores_bound_names(memo):
+    namespace = {"work": lambda: 5}
+    assert run(memo, "import os\nr = work()\nr", namespace) == 5
+    namespace2 = {"work": namespace["work"]}
+    assert run(memo, "import os\nr = work()\nr", namespace2) == 5
+    assert namespace2["r"] == 5
+    assert namespace2["os"] is os
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+def test_key_ignores_names_bound_before_use(memo):
+    snippet = CodeCache().compile("r = 1\nr")
+    assert memo.key(snippet, "r = 1\nr", {"r": 1}) == memo.key(snippet, "r = 1\nr", {"r": 2})
+
+
+def test_unreadable_entries_are_misses(memo):
+    assert run(memo, "x = 1", {}) is None
+    (path,) = [path for _, _, path in memo.entries()]
+    with open(path, "wb") as fh:
+        fh.write(b"\x80\x04not a pickle")
+    assert memo.load(os.path.basename(path)[:-len(".pickle")]) is None
+    assert not os.path.exists(path)
+
+
+def test_oldest_entries_are_evicted(memo):
+    memo.max_bytes = 1
+    assert not memo.store("big", {"names": {}, "result": "x" * 100})
+    memo.max_bytes = 400
+    for index in range(5):
+        memo.store("key%d" % index, {"names": {}, "result": "x" * 100})
+    assert memo.size() <= 400
+    assert os.path.exists(memo.path("key4"))
+    assert not os.path.exists(memo.path("key0"))
@@ -0,0 +1,37 @@
+import pstats
+import sys
+
+import pytest
+
+from widgets.compiler import CodeCache
+from widgets.profiling import parse_profile, profile_run
+
+
+def test_parse_profile_options():
+    assert parse_profile("") == ("cumulative", 30, None)
+    assert parse_profile("-s calls -l 5 -o out.pstats") == ("calls", 5, "out.pstats")
+    with pytest.raises(ValueError):
+        parse_profile("-s nothing")
+    with pytest.raises(ValueError):
+        parse_profile("code")
+
+
+def test_profile_run_prints_a_report(capsys):
+    namespace = {}
+    result, profile = profile_run(CodeCache().compile("def f():\n    return 1\nf()"), namespace, limit=5)
+    assert result == 1
+    assert "function calls" in capsys.readouterr().out
+
+
+def test_profile_run_saves_stats_and_restores_the_hook(tmpdir, capsys):
+    def hook(frame, event, arg):
+        pass
+    path = str(tmpdir.join("out.pstats"))
+    sys.setprofile(hook)
+    try:
+        profile_run(CodeCache().compile("sum(range(10))"), {}, path=path)
+        assert sys.getprofile() is hook
+    finally:
+        sys.setprofile(None)
+    assert "Profile saved to %s" % path in capsys.readouterr().out
+    assert pstats.Stats(path).total_calls > 0
@@ -0,0 +1,34 @@
+from widgets.scrollback import Scrollback
+
+
+def test_lines_follow_the_document_blocks():
+    scrollback = Scrollback()
+    scrollback.append("one\ntwo")
+    scrollback.append(" more\nthree")
+    assert list(scrollback) == ["one", "two more", "three"]
+    assert scrollback.line(1) == "two more"
+
+
+def test_oldest_lines_are_evicted_first():
+    scrollback = Scrollback(max_lines=3)
+    evicted = scrollback.append("a\nb\nc\nd\ne")
+    assert evicted == 2
+    assert scrollback.first_line == 2
+    assert list(scrollback) == ["c", "d", "e"]
+    assert scrollback.line(2) == "c"
+
+
+def test_sizes_are_utf8_bytes():
+    scrollback = Scrollback(max_bytes=8)
+    scrollback.append(u"éé\n")
+    assert scrollback.size == 5
+    scrollback.append(u"€€")
+    assert scrollback.dropped_bytes == 5
+    assert scrollback.size == 6
+
+
+def test_search_uses_absolute_line_numbers():
+    import re
+    scrollback = Scrollback(max_lines=3)
+    scrollback.append("x\ny\nx\ny\nx")
+    assert scrollback.search(re.compile("x"), 0, 10) == [2, 4]
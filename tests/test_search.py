@@ -0,0 +1,46 @@
+import re
+
+import pytest
+
+from widgets.scrollback import Scrollback
+from widgets.search import LineFilter
+
+
+def make_filter(text, **limits):
+    scrollback = Scrollback(**limits)
+    scrollback.append(text)
+    return scrollback, LineFilter(scrollback)
+
+
+def test_open_line_is_not_scanned():
+    scrollback, line_filter = make_filter("error 1\nok\nerror 2")
+    line_filter.setPattern("ERROR")
+    assert line_filter.matches == [0]
+    scrollback.append("\n")
+    assert line_filter.update() == (0, [2])
+    assert line_filter.matches == [0, 2]
+
+
+def test_longer_pattern_narrows_previous_matches():
+    _, line_filter = make_filter("error 1\nerror 2\n")
+    line_filter.setPattern("error")
+    line_filter.setPattern("error 2")
+    assert line_filter.matches == [1]
+
+
+def test_evicted_matches_are_dropped():
+    scrollback, line_filter = make_filter("a\nb\na\n", max_lines=4)
+    line_filter.setPattern("a")
+    assert line_filter.matches == [0, 2]
+    scrollback.append("a\nb\n")
+    assert line_filter.update() == (1, [3])
+    assert line_filter.matches == [2, 3]
+
+
+def test_invalid_regex_keeps_current_filter():
+    _, line_filter = make_filter("a\nb\n")
+    line_filter.setPattern("a")
+    with pytest.raises(re.error):
+        line_filter.setPattern("(", regex=True)
+    assert line_filter.pattern == "a"
+    assert line_filter.matches == [0]
@@ -0,0 +1,35 @@
+import re
+
+import pytest
+
+from widgets.spool import SpoolFile
+
+
+@pytest.fixture
+def spool(tmpdir):
+    spool = SpoolFile(directory=str(tmpdir))
+    yield spool
+    spool.close()
+
+
+def test_lines_are_read_back_from_the_file(spool):
+    assert spool.append(u"first\nsec") == 1
+    spool.append(u"ond é\nthird")
+    assert len(spool) == 3
+    assert spool.line(1) == u"second é"
+    assert spool.line(2) == u"third"
+    assert spool.line(0, limit=3) == u"fir"
+
+
+def test_search_reports_each_line_once(spool):
+    spool.append(u"aa\nb\na\n")
+    assert spool.search(re.compile("a"), 0, len(spool)) == [0, 2]
+    assert spool.search(re.compile("A", re.IGNORECASE), 1, 3) == [2]
+
+
+def test_clear_empties_the_log(spool):
+    spool.append(u"a\nb")
+    spool.clear()
+    assert len(spool) == 1
+    assert spool.size == 0
+    assert spool.line(0) == u""
@@ -0,0 +1,82 @@
+import pytest
+
+
+@pytest.fixture
+def stream(qt_import):
+    return qt_import("widgets.stream")
+
+
+@pytest.fixture
+def router(stream):
+    router = stream.OutputRouter(pump_events=False)
+    yield router
+    router.uninstall()
+
+
+def texts(chunks):
+    return "".join(chunk[3] for chunk in chunks)
+
+
+def test_assemble_keeps_unfinished_lines_per_thread(router):
+    chunks = router._assemble([
+        ("stdout", 1, 1, 0.0, "a1\na"),
+        ("stdout", 2, 1, 0.0, "b1\nb"),
+        ("stdout", 1, 1, 0.0, "2\n"),
+    ], final=False)
+    assert texts(chunks) == "a1\nb1\na2\n"
+    assert texts(router._assemble([], final=True)) == "b"
+
+
+def test_collapse_only_runs_of_collapse_min(router):
+    chunks = [("stdout", 1, 0.0, "x\n\n\n\ny\na\na\nb\nb\nb\nc\n")]
+    assert texts(router._collapse(chunks, True, 0.0)) == "x\n\n\n\ny\na\na\nb (x3)\nc\n"
+    assert router.collapsed_lines == 2
+
+
+def test_collapse_holds_the_newest_line(router):
+    assert texts(router._collapse([("stdout", 1, 0.0, "a\na\n")], False, 0.0)) == ""
+    assert texts(router._collapse([("stdout", 1, 0.0, "a\n")], False, 0.0)) == ""
+    assert texts(router._collapse([], False, 1.0)) == "a (x3)\n"
+
+
+def test_limit_carries_unused_allowance_forward(router):
+    router.max_rate = 1000
+    router._tokens = 0.0
+    line = "x" * 99 + "\n"
+    # 50 ms worth, no line break fits so the first line is cut.
+    assert texts(router._limit([("stdout", 1, 0.0, line)], 0.05, 0.0)) == "x" * 50
+    assert texts(router._limit([], 0.05, 0.0)) == "x" * 49 + "\n"
+    # An idle batch leaves its allowance to the next one.
+    router._limit([], 0.05, 0.0)
+    assert texts(router._limit([("stdout", 1, 0.0, line * 20)], 0.05, 0.0)) == line
+    # Allowance builds up to one second's worth at most.
+    assert len(texts(router._limit([], 5.0, 0.0))) == 1000
+    assert len(texts(router._limit([], 5.0, 0.0))) == 900
+    assert router._backlog == []
+
+
+def test_limit_reports_dropped_output(router):
+    router._overflow = 10
+    chunks = router._limit([("stdout", 1, 0.0, "a\n")], 0.05, 0.0)
+    assert chunks[-1][3] == "[... 10 characters of output dropped ...]\n"
+    assert router.dropped_chars == 10
+
+
+def test_print_loop_on_the_gui_thread_is_rate_limited(router, stream, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(stream.time, "time", lambda: clock[0])
+    router.max_rate = 100000
+    router._tokens = 0.0
+    router._last_flush = clock[0]
+    batches = []
+    router.written.connect(batches.append)
+    with router.capture():
+        for index in range(20000):
+            router.put("stdout", "%d %s\n" % (index, "x" * 1000))
+            clock[0] += 0.0001
+    # Two seconds of printing: no more than one batch per interval, and no
+    # more than two seconds' worth of output.
+    assert len(batches) <= 2000 // router.interval + 1
+    sent = sum(len(chunk[3]) for batch in batches for chunk in batch if chunk[0] == "stdout")
+    assert sent <= 2 * router.max_rate
+    assert router._backlog
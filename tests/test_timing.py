@@ -0,0 +1,45 @@
+from widgets.compiler import CodeCache
+from widgets import timing
+from widgets.timing import format_time, parse_timeit, time_repeated, time_run
+
+
+def test_format_time_picks_a_unit():
+    assert format_time(2.5) == "2.5 s"
+    assert format_time(0.0015) == "1.5 ms"
+    assert format_time(2e-6) == u"2 µs"
+    assert format_time(3e-9) == "3 ns"
+
+
+def test_parse_timeit_options():
+    assert parse_timeit("-n 10 -r3 x + 1") == (10, 3, "x + 1")
+    assert parse_timeit("x") == (0, 7, "x")
+
+
+def test_time_run_prints_and_returns(capsys):
+    assert time_run(CodeCache().compile("1 + 1"), {}) == 2
+    output = capsys.readouterr().out
+    assert "CPU times" in output
+    assert "Wall time" in output
+
+
+def test_time_repeated_uses_the_namespace(capsys):
+    runs = time_repeated("x * 2", {"x": 3}, number=5, repeat=2)
+    assert len(runs) == 2
+    assert "(2 runs, 5 loops each)" in capsys.readouterr().out
+
+
+def test_function_timer_reads_the_namespace():
+    # What Python 2 gets, its Timer takes no globals.
+    namespace = {"x": 3, "calls": []}
+    timer = timing._function_timer("calls.append(x)\ny = x", namespace)
+    timer.timeit(4)
+    assert namespace["calls"] == [3] * 4
+    assert "y" not in namespace
+    timing._function_timer("", {}).timeit(1)
+
+
+def test_autorange_without_timer_support():
+    class Timer(object):
+        def timeit(self, number):
+            return number * 0.01
+    assert timing._autorange(Timer()) == 20
@@ -0,0 +1,95 @@
+import asyncio
+import sys
+import traceback
+
+from Qt import QtCore
+
+from .coroutines import reporting
+
+
+def _once(function):
+    called = []
+
+    def call(*args):
+        if not called:
+            called.append(True)
+            function(*args)
+    return call
+
+
+class QtAsyncioLoop(QtCore.QObject):
+    """An asyncio event loop driven by the Qt event loop.
+
+    While tasks are pending a timer runs one iteration of the asyncio loop
+    every `interval` milliseconds, without waiting on its selector, so the
+    GUI never blocks.  Tasks keep running between executions; what they
+    print goes to `router`, under the latest execution.
+    """
+    def __init__(self, router, parent=None, interval=10):
+        super(QtAsyncioLoop, self).__init__(parent)
+        self.router = router
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_exception_handler(self._exceptionHandler)
+        self._reporting = {}
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.step)
+
+    @property
+    def pending(self):
+        return [task for task in asyncio.all_tasks(self.loop) if not task.done()]
+
+    def run(self, coroutine, done=None):
+        """Schedule `coroutine` as a task, `done(result, error, cancelled)` is called once it finishes.
+
+        A task cancelled before its first step never runs the coroutine
+        that reports, `step` reports those.
+        """
+        if done is None:
+            task = self.loop.create_task(coroutine)
+        else:
+            done = _once(done)
+            task = self.loop.create_task(reporting(coroutine, done))
+            self._reporting[task] = (coroutine, done)
+        self._timer.start()
+        return task
+
+    def step(self):
+        if self.loop.is_running():
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # Code on this thread is inside another loop's run, e.g. while
+            # the event pump keeps the UI alive.
+            return
+        with self.router.routed():
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()
+            for task in [task for task in self._reporting if task.done()]:
+                coroutine, done = self._reporting.pop(task)
+                if task.cancelled():
+                    # Never awaited if the task was cancelled straight away.
+                    coroutine.close()
+                    done(None, None, True)
+        if not self.pending:
+            self._timer.stop()
+
+    def cancelAll(self):
+        for task in self.pending:
+            task.cancel()
+        self._timer.start()
+
+    def close(self):
+        self._timer.stop()
+        if not self.loop.is_running():
+            self.loop.close()
+
+    def _exceptionHandler(self, loop, context):
+        # Runs inside `step`, so this reaches the output pane.
+        exception = context.get("exception")
+        sys.stderr.write("%s\n" % context.get("message", "Unhandled exception in event loop"))
+        if exception is not None:
+            traceback.print_exception(type(exception), exception, exception.__traceback__)
@@ -0,0 +1,114 @@
+import ast
+
+
+class _BoundNames(ast.NodeVisitor):
+    def __init__(self):
+        self.names = set()
+        self.depth = 0
+
+    def visit_Name(self, node):
+        if self.depth == 0 and isinstance(node.ctx, (ast.Store, ast.Del)):
+            self.names.add(node.id)
+
+    def visit_alias(self, node):
+        if self.depth == 0 and node.name != "*":
+            self.names.add((node.asname or node.name).split(".")[0])
+
+    def visit_Global(self, node):
+        # Functions declaring a global may rebind it whenever they're called.
+        self.names.update(node.names)
+
+    def _visit_scope(self, node):
+        if self.depth == 0:
+            self.names.add(node.name)
+        for decorator in getattr(node, "decorator_list", []):
+            self.visit(decorator)
+        self.depth += 1
+        for child in node.body:
+            self.visit(child)
+        self.depth -= 1
+
+    visit_FunctionDef = _visit_scope
+    visit_AsyncFunctionDef = _visit_scope
+    visit_ClassDef = _visit_scope
+
+    def visit_Lambda(self, node):
+        self.depth += 1
+        self.generic_visit(node)
+        self.depth -= 1
+
+    def visit_ExceptHandler(self, node):
+        if self.depth == 0 and isinstance(node.name, str):
+            self.names.add(node.name)
+        self.generic_visit(node)
+
+
+def bound_names(tree):
+    """Return the names a module-level snippet can bind or delete in its namespace.
+
+    Only the syntax tree is inspected, so the cost depends on the size of
+    the snippet and not on the size of the namespace.  Names set through
+    globals() or setattr on a module can't be seen this way.
+    """
+    visitor = _BoundNames()
+    visitor.visit(tree)
+    return visitor.names
+
+
+class _UsedNames(ast.NodeVisitor):
+    def __init__(self):
+        self.names = set()
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.names.add(node.id)
+
+    def visit_AugAssign(self, node):
+        # `x += 1` reads x before binding it.
+        if isinstance(node.target, ast.Name):
+            self.names.add(node.target.id)
+        self.generic_visit(node)
+
+
+def used_names(tree):
+    """Return the names a snippet reads, at any depth.
+
+    Names read inside function bodies count as well, the functions may be
+    called by the snippet itself.  Locals of those functions are included
+    too, which errs on the side of seeing a dependency that isn't there.
+    """
+    visitor = _UsedNames()
+    visitor.visit(tree)
+    return visitor.names
+
+
+# Top-level statements that bind their targets whenever they complete.
+_BINDING = tuple(
+    getattr(ast, name) for name in ("Assign", "AugAssign", "AnnAssign", "Import", "ImportFrom")
+    if hasattr(ast, name)
+)
+_DEFINING = tuple(
+    getattr(ast, name) for name in ("FunctionDef", "AsyncFunctionDef", "ClassDef")
+    if hasattr(ast, name)
+)
+
+
+def free_names(tree):
+    """Return the names a module-level snippet may read before binding them itself.
+
+    Top-level statements are taken in order, and a name bound by an
+    earlier simple statement, like `r` in `r = f(); r`, isn't included.
+    Names bound inside compound statements might not be bound at all, so
+    they don't hide later reads.  Function bodies are read as if they ran
+    where they're defined.
+    """
+    bound = set()
+    free = set()
+    for statement in tree.body:
+        free.update(used_names(statement) - bound)
+        if isinstance(statement, _DEFINING):
+            bound.add(statement.name)
+        elif isinstance(statement, _BINDING) and getattr(statement, "value", True) is not None:
+            # An annotation without a value doesn't bind anything.
+            bound.update(bound_names(statement))
+    return free
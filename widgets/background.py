@@ -0,0 +1,22 @@
+"""Helpers shared by the sessions that run code away from the console.
+
+Nothing in here may import Qt, the kernel process imports it as well.
+"""
+import os
+import threading
+
+
+def package_root():
+    """Return the directory that has to be on sys.path to import this package by its full name."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(__name__.count(".")):
+        root = os.path.dirname(root)
+    return root
+
+
+def start_thread(name, target, *args):
+    """Start a daemon thread running target(*args)."""
+    thread = threading.Thread(target=target, args=args, name=name)
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,141 @@
+import re
+
+CELL_MARKER = re.compile(r"^\s*#\s*%%(.*)$")
+
+
+class Cell(object):
+    """A `# %%` delimited part of the editor.
+
+    `line` is the buffer line the source starts on, the marker line itself
+    isn't part of the source.  `key` is the CodeCache key of the source,
+    so the compiled code of the cell is found in the cache under it.
+    """
+    __slots__ = ("index", "line", "title", "source", "key")
+
+    def __init__(self, index, line, title, source, key):
+        self.index = index
+        self.line = line
+        self.title = title
+        self.source = source
+        self.key = key
+
+    @property
+    def empty(self):
+        return not self.source.strip()
+
+    @property
+    def end(self):
+        if not self.source:
+            return self.line
+        return self.line + self.source.count("\n") + 1
+
+    def label(self):
+        return self.title or "cell %d" % (self.index + 1)
+
+
+def split_cells(text, key):
+    """Split `text` on `# %%` lines, `key(source)` hashes each cell's source.
+
+    Text before the first marker is a cell of its own.
+    """
+    cells = []
+    lines = text.split("\n")
+    start, title = 0, ""
+    for number, line in enumerate(lines + [None]):
+        match = CELL_MARKER.match(line) if line is not None else None
+        if line is not None and match is None:
+            continue
+        if number > start or cells or title:
+            source = "\n".join(lines[start:number])
+            cells.append(Cell(len(cells), start, title, source, key(source)))
+        if match is not None:
+            start, title = number + 1, match.group(1).strip()
+    return cells
+
+
+class CellTracker(object):
+    """Remembers which version of every cell last ran successfully.
+
+    Cells are identified by their position in the buffer, so inserting a
+    cell marks the ones after it as changed: re-running too much is safer
+    than skipping a cell whose inputs moved.
+
+    The names each cell binds and reads are those of its compiled snippet
+    in the code cache, so they reflect the cache's transforms.  A cell
+    depends on the nearest cell above it that binds a name it reads,
+    `dependents` follows those edges.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self._run = {}
+
+    def cells(self, text):
+        return split_cells(text, self.cache.key)
+
+    def cellAt(self, text, line):
+        for cell in self.cells(text):
+            if cell.line - 1 <= line < cell.end:
+                return cell
+        return None
+
+    def isChanged(self, cell):
+        return self._run.get(cell.index) != cell.key
+
+    def changed(self, text):
+        return [cell for cell in self.cells(text) if not cell.empty and self.isChanged(cell)]
+
+    def names(self, cell):
+        """Return the (bound, read) names of a cell, both empty if it doesn't compile."""
+        try:
+            snippet = self.cache.compile(cell.source)
+        except SyntaxError:
+            return frozenset(), frozenset()
+        return snippet.names, snippet.used
+
+    def graph(self, cells):
+        """Map the index of every cell to the indices of the cells reading what it binds."""
+        edges = dict((cell.index, set()) for cell in cells)
+        binders = {}
+        for cell in cells:
+            bound, used = self.names(cell)
+            for name in used:
+                binder = binders.get(name)
+                if binder is not None and binder != cell.index:
+                    edges[binder].add(cell.index)
+            for name in bound:
+                binders[name] = cell.index
+        return edges
+
+    def dependents(self, text, cells):
+        """Return `cells` and every cell downstream of them, in topological order."""
+        everything = self.cells(text)
+        edges = self.graph(everything)
+        wanted = set(cell.index for cell in cells)
+        stack = list(wanted)
+        while stack:
+            for index in edges[stack.pop()]:
+                if index not in wanted:
+                    wanted.add(index)
+                    stack.append(index)
+        # Kahn's algorithm over the affected cells, ties broken by buffer order.
+        incoming = dict((index, 0) for index in wanted)
+        for index in wanted:
+            for target in edges[index]:
+                incoming[target] += 1
+        ready = sorted(index for index, count in incoming.items() if not count)
+        order = []
+        while ready:
+            index = ready.pop(0)
+            order.append(index)
+            for target in sorted(edges[index]):
+                incoming[target] -= 1
+                if not incoming[target]:
+                    ready.append(target)
+            ready.sort()
+        return [everything[index] for index in order if not everything[index].empty]
+
+    def markRun(self, cell):
+        self._run[cell.index] = cell.key
+
+    def reset(self):
+        self._run.clear()
@@ -0,0 +1,107 @@
+import array
+import bisect
+
+STDOUT = 0
+STDERR = 1
+STREAMS = {"stdout": STDOUT, "stderr": STDERR}
+
+try:
+    _LINES_TYPE = "Q"
+    array.array(_LINES_TYPE)
+except ValueError:
+    _LINES_TYPE = "L"
+
+
+class ChunkTable(object):
+    """Where every chunk of output came from, stored column-wise in arrays.
+
+    For each chunk the table keeps the absolute line it starts on, the stream
+    it was written to, the execution that produced it and when it was
+    written, which costs 21 bytes per chunk instead of a Python object.
+    Chunks are kept in the order they were appended so their start lines
+    never decrease.
+    """
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.lines) - self._start
+
+    def clear(self):
+        self.lines = array.array(_LINES_TYPE)
+        self.streams = array.array("B")
+        self.executions = array.array("I")
+        self.timestamps = array.array("d")
+        self._start = 0
+        self._first = {}
+        self._last = {}
+
+    def append(self, line, stream, execution, timestamp):
+        index = len(self.lines)
+        self.lines.append(line)
+        self.streams.append(STREAMS.get(stream, STDOUT))
+        self.executions.append(execution)
+        self.timestamps.append(timestamp)
+        self._first.setdefault(execution, index)
+        self._last[execution] = index
+
+    def find(self, line):
+        """Return the index of the chunk that covers an absolute line, or -1."""
+        index = bisect.bisect_right(self.lines, line, self._start) - 1
+        return index if index >= self._start else -1
+
+    def stream(self, line):
+        index = self.find(line)
+        return self.streams[index] if index != -1 else STDOUT
+
+    def execution(self, line):
+        index = self.find(line)
+        return self.executions[index] if index != -1 else 0
+
+    def endLine(self, index):
+        if index + 1 < len(self.lines):
+            return self.lines[index + 1]
+        return None
+
+    def ranges(self, execution=None, stream=None):
+        """Yield (first line, end line) for chunks matching an execution and/or stream.
+
+        The end line of the newest chunk is None as it is still open.
+        """
+        start = self._start
+        stop = len(self.lines)
+        if execution is not None:
+            if execution not in self._first:
+                return
+            start = max(start, self._first[execution])
+            stop = self._last[execution] + 1
+        for index in range(start, stop):
+            if execution is not None and self.executions[index] != execution:
+                continue
+            if stream is not None and self.streams[index] != stream:
+                continue
+            yield self.lines[index], self.endLine(index)
+
+    def firstLine(self, execution):
+        if execution not in self._first or self._last[execution] < self._start:
+            return None
+        return self.lines[max(self._first[execution], self._start)]
+
+    def trim(self, first_line):
+        """Forget chunks that lie entirely before `first_line`."""
+        start = self._start
+        while start + 1 < len(self.lines) and self.lines[start + 1] <= first_line:
+            start += 1
+        self._start = start
+        if start > 4096 and start * 2 > len(self.lines):
+            self._compact()
+
+    def _compact(self):
+        start = self._start
+        del self.lines[:start]
+        del self.streams[:start]
+        del self.executions[:start]
+        del self.timestamps[:start]
+        self._last = dict((key, value - start) for key, value in self._last.items() if value >= start)
+        self._first = dict((key, max(self._first[key] - start, 0)) for key in self._last)
+        self._start = 0
@@ -0,0 +1,111 @@
+import ast
+import collections
+import hashlib
+import inspect
+
+import six
+
+from .analysis import bound_names, free_names
+
+# Lets `await` be used at the top level of a submission, such code
+# compiles to a coroutine instead of running straight away.
+TOP_LEVEL_AWAIT = getattr(ast, "PyCF_ALLOW_TOP_LEVEL_AWAIT", 0)
+
+
+def is_coroutine(code):
+    return code is not None and bool(code.co_flags & getattr(inspect, "CO_COROUTINE", 0))
+
+
+class CompiledSnippet(object):
+    """A submission parsed once and split into a body and a trailing expression.
+
+    When the last statement is an expression it is compiled separately in
+    eval mode so its value can be displayed after the body has run.
+    `names` are the names the snippet can bind, `used` the names it may
+    read from the namespace before binding them.
+    Snippets that use top-level `await` are `is_async` and have to be run
+    with `coroutines.run_async` on an event loop.
+    """
+    __slots__ = ("body", "expression", "names", "used", "is_async")
+
+    def __init__(self, body, expression, names, used=frozenset()):
+        self.body = body
+        self.expression = expression
+        self.names = names
+        self.used = used
+        self.is_async = is_coroutine(body) or is_coroutine(expression)
+
+    def run(self, namespace):
+        if self.body is not None:
+            six.exec_(self.body, namespace)
+        if self.expression is not None:
+            return eval(self.expression, namespace)
+        return None
+
+
+class CodeCache(object):
+    """LRU cache of compiled snippets keyed by a hash of their source.
+
+    Every parsed submission is passed through `transforms`, a sequence of
+    ast.NodeTransformer classes or instances, before it is compiled, so the
+    rewritten code is cached along with everything else.  Changing the
+    pipeline drops the cache.
+    """
+    def __init__(self, maxsize=256, filename="<console>", transforms=()):
+        self.maxsize = maxsize
+        self.filename = filename
+        self.transforms = list(transforms)
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(source):
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def compile(self, source):
+        key = self.key(source)
+        snippet = self._entries.pop(key, None)
+        if snippet is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            snippet = self._compile(source)
+        self._entries[key] = snippet
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return snippet
+
+    def _compile(self, source):
+        tree = ast.parse(source, self.filename, "exec")
+        for transform in self.transforms:
+            if isinstance(transform, type):
+                transform = transform()
+            tree = transform.visit(tree)
+        ast.fix_missing_locations(tree)
+        names = frozenset(bound_names(tree))
+        used = frozenset(free_names(tree))
+        expression = None
+        if tree.body and isinstance(tree.body[-1], ast.Expr):
+            expression = compile(ast.Expression(tree.body.pop().value), self.filename, "eval", TOP_LEVEL_AWAIT)
+        body = compile(tree, self.filename, "exec", TOP_LEVEL_AWAIT) if tree.body else None
+        return CompiledSnippet(body, expression, names, used)
+
+    def addTransform(self, transform):
+        self.transforms.append(transform)
+        self._entries.clear()
+
+    def removeTransform(self, transform):
+        self.transforms.remove(transform)
+        self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,44 @@
+"""Running snippets that use top-level `await`.
+
+Python 2 can't parse this module, it's only imported where asyncio is
+available.  Nothing in here may import Qt, the kernel process imports it
+as well.
+"""
+import asyncio
+
+from .compiler import is_coroutine
+
+
+async def run_async(snippet, namespace):
+    """Run a compiled snippet, awaiting its body and trailing expression where they're coroutines."""
+    if snippet.body is not None:
+        coroutine = eval(snippet.body, namespace)
+        if is_coroutine(snippet.body):
+            await coroutine
+    if snippet.expression is None:
+        return None
+    result = eval(snippet.expression, namespace)
+    if is_coroutine(snippet.expression):
+        result = await result
+    return result
+
+
+async def reporting(coroutine, done):
+    """Await `coroutine`, then call done(result, error, cancelled).
+
+    `done` is called from inside the task rather than added as a done
+    callback: those are only scheduled on the loop, and a loop stepped
+    while tasks are pending may never get to run them.
+    """
+    try:
+        result = await coroutine
+    except asyncio.CancelledError:
+        done(None, None, True)
+        raise
+    except BaseException as err:
+        # Reported through `done`, the loop's exception handler would
+        # otherwise print it a second time.
+        done(None, err, False)
+        return None
+    done(result, None, False)
+    return result
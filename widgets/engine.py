@@ -0,0 +1,167 @@
+import contextlib
+import ctypes
+import sys
+import threading
+import time
+
+from Qt import QtCore
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+def raise_in_thread(ident, exception=KeyboardInterrupt):
+    """Asynchronously raise an exception in another Python thread.
+
+    The exception is only delivered once the thread executes Python
+    bytecode again, code blocked inside a C call is interrupted when the
+    call returns.
+    """
+    count = ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), ctypes.py_object(exception))
+    if count > 1:
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), None)
+        raise SystemError("PyThreadState_SetAsyncExc affected %d threads" % count)
+    return count == 1
+
+
+class ThreadedExecutor(QtCore.QObject):
+    """Runs one function at a time on a worker thread.
+
+    `finished` is emitted from the worker with the exception the function
+    raised, or None, and reaches receivers on the GUI thread through a
+    queued connection.  The executor stops `running` just before that, so
+    receivers can start the next function even though the worker thread
+    may not have exited yet.
+    """
+    started = QtCore.Signal()
+    finished = QtCore.Signal(object)
+
+    def __init__(self, parent=None):
+        super(ThreadedExecutor, self).__init__(parent)
+        self._thread = None
+        self._running = threading.Event()
+        self._busy = threading.Event()
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    def execute(self, function, *args):
+        if self.running:
+            raise RuntimeError("Code is still running in the background")
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(function, args),
+            name="QtPythonConsole-execution"
+        )
+        self._thread.daemon = True
+        self._running.set()
+        self._thread.start()
+        self.started.emit()
+
+    def cancel(self):
+        # Only interrupt while the function itself runs, an exception landing
+        # in _run's bookkeeping would swallow the finished signal.
+        if not self.running or not self._busy.is_set():
+            return False
+        return raise_in_thread(self._thread.ident, KeyboardInterrupt)
+
+    def _run(self, function, args):
+        error = None
+        try:
+            self._busy.set()
+            try:
+                function(*args)
+            finally:
+                self._busy.clear()
+        except BaseException as err:
+            error = err
+        self._running.clear()
+        self.finished.emit(error)
+
+
+class EventPump(object):
+    """Keeps the host's event loop running while code executes on the GUI thread.
+
+    While installed, a profile hook runs on every Python call and return in
+    the GUI thread and calls QApplication.processEvents at most once every
+    `interval` seconds.  When `stop` has been requested, the hook raises
+    KeyboardInterrupt into the running code.  Pure Python loops that make no
+    calls don't trigger the hook.  A line trace would catch those too, but
+    it costs far more.
+    """
+    def __init__(self, interval=0.03):
+        self.interval = interval
+        self.calls = 0
+        self.pumps = 0
+        self.pump_time = 0.0
+        self.elapsed = 0.0
+        self._next = 0.0
+        self._pumping = False
+        self._stop = False
+        self.call_cost = self._calibrate()
+
+    @property
+    def overhead(self):
+        """Estimated seconds the hook itself added to the last run."""
+        return self.calls * self.call_cost
+
+    def _calibrate(self, samples=10000):
+        # Time the hook's fast path so overhead can be estimated without
+        # timing every call.
+        self._next = float("inf")
+        start = _clock()
+        for _ in range(samples):
+            self._hook(None, "call", None)
+        cost = (_clock() - start) / samples
+        self.calls = 0
+        return cost
+
+    def stop(self):
+        self._stop = True
+
+    @contextlib.contextmanager
+    def installed(self):
+        previous = sys.getprofile()
+        self.calls = 0
+        self.pumps = 0
+        self.pump_time = 0.0
+        self._stop = False
+        start = _clock()
+        self._next = start + self.interval
+        sys.setprofile(self._hook)
+        try:
+            yield self
+        finally:
+            sys.setprofile(previous)
+            self.elapsed = _clock() - start
+
+    def _hook(self, frame, event, arg):
+        self.calls += 1
+        if self._pumping:
+            return
+        now = _clock()
+        if now < self._next:
+            return
+        self._pumping = True
+        try:
+            QtCore.QCoreApplication.processEvents()
+        finally:
+            self._pumping = False
+        self.pumps += 1
+        self._next = _clock()
+        self.pump_time += self._next - now
+        self._next += self.interval
+        if self._stop:
+            self._stop = False
+            raise KeyboardInterrupt
+
+    def summary(self):
+        return "kept UI alive: %d updates, %.1f ms in events, ~%.1f ms hook overhead (%.1f%%)" % (
+            self.pumps,
+            self.pump_time * 1000,
+            self.overhead * 1000,
+            100.0 * self.overhead / self.elapsed if self.elapsed else 0.0,
+        )
@@ -1,7 +1,10 @@
 import contextlib
+import functools
+import os
+import re
 import sys
 import json
-import re
+import traceback
 import types
 
 from Qt import QtCore, QtGui, QtWidgets
@@ -10,22 +13,47 @@ import six
 from six import text_type
 
 from QtPythonConsole.user import User
+from .cells import CellTracker
+from .compiler import CodeCache
+from .engine import EventPump, ThreadedExecutor
+from .kernel import KernelClient
+from .memo import MemoCache
+from . import profiling
+from .scheduler import ExecutionQueue
+from . import timing
+try:
+    from . import subinterp
+except SyntaxError:
+    # The sub-interpreter module doesn't parse on Python 2.
+    subinterp = None
 from .utils import Completer, MyHighlighter
+try:
+    from .aio import QtAsyncioLoop
+    from .coroutines import run_async
+except (ImportError, SyntaxError):
+    # Python 2 has neither asyncio nor `async def`, nothing compiles to a
+    # coroutine there either.
+    QtAsyncioLoop = None
 from .textedit import TextEdit
 
 DEFAULT_CODE = '#use the variable "projects" to refer to currently selected items in the project tree'
+_MISSING = object()
+# A submission whose first line is `%name arguments` is handled by a magic.
+MAGIC_LINE = re.compile(r"^%(\w+)(?:[ \t]+(.*))?$")
 
 
 class InputConsole(TextEdit):
     code = QtCore.Signal(str)
     clear_output = QtCore.Signal()
     CODE_EXECUTED = QtCore.Signal()
+    EXECUTION_STARTED = QtCore.Signal()
+    _kernel_done = QtCore.Signal(object, object)
     LINE_CONST = "LINENUMBERCONST"
     EXCEPTION_MESSAGE = """
 RuntimeError: The following exception was thrown while executing code from line {start_row}-{end_row}:
     {exception}"""
 
-    def __init__(self, parent=None, code=None, appname=None, stdout=None):
+    def __init__(self, parent=None, code=None, appname=None, stdout=None, namespace=None, kernel_executable=None):
         super(InputConsole, self).__init__(parent)
         self.completer = None
         self.setCompleter(Completer([]))
@@ -40,8 +68,76 @@ RuntimeError: The following exception was thrown while executing code from line
         self.highlighter = MyHighlighter(self.document())
         self.cursorPositionChanged.connect(self.highlightCurrentLine)
 
-        self.locals_added = self.parent().locals
-        self.locals_removed = {}
+        # Code runs in one persistent namespace, by default the locals the
+        # ConsoleWidget was created with.
+        if namespace is None:
+            namespace = self.parent().locals
+        self.namespace = namespace
+        self.namespace.setdefault("__name__", "__main__")
+        self.namespace.setdefault("__builtins__", six.moves.builtins)
+        self.touched = set()
+        self.code_cache = CodeCache()
+
+        # Opt-in: run submissions on a worker thread so the host stays
+        # responsive, output comes back through the thread-safe router.
+        self.threaded = False
+        self.executor = ThreadedExecutor(self)
+        self.executor.finished.connect(self.backgroundFinished)
+
+        # Opt-in for code that has to stay on the GUI thread: keep the event
+        # loop turning during the run so the host doesn't look hung.
+        self.pump_events = False
+        self.pump = EventPump()
+        self._executing = False
+
+        # Opt-in: run submissions in a separate Python process, a crash there
+        # only takes the kernel down.  The kernel has its own namespace and
+        # runs in `kernel_executable`, a Python interpreter found by
+        # KernelClient if it isn't given.
+        self.use_kernel = False
+        self.kernel = KernelClient(self.kernelOutput, self._kernel_done.emit, kernel_executable)
+        self._kernel_done.connect(self.kernelFinished)
+
+        # Opt-in: an isolated sub-interpreter with its own GIL, where the
+        # Python version supports it.  Otherwise code runs in-process.
+        self.use_subinterpreter = False
+        self.subinterpreter = None
+        if subinterp is not None:
+            self.subinterpreter = subinterp.SubInterpreterSession(self.kernelOutput, self._kernel_done.emit)
+
+        # Submissions using top-level await run as tasks on an asyncio loop
+        # stepped by Qt, the GUI stays responsive while they wait.
+        self.event_loop = QtAsyncioLoop(self.stdout, self) if QtAsyncioLoop is not None else None
+        self._task = None
+
+        # Submissions made while code runs wait here.  The next one starts
+        # once control is back in the event loop, a failed run pauses it.
+        self.queue = ExecutionQueue(self)
+        self.queue.pausedChanged.connect(self.queuePaused)
+        self.CODE_EXECUTED.connect(self.runQueued, QtCore.Qt.QueuedConnection)
+        self._failed = False
+        self._current = None
+
+        # `# %%` cells, and which version of each last ran successfully.
+        self.cells = CellTracker(self.code_cache)
+        # Also re-run the cells reading names that the run cells bind.
+        self.reactive_cells = False
+
+        # `%name` handlers, each takes the arguments on the magic line and
+        # the code below it and returns (code, runner).  A runner replaces
+        # `snippet.run` and is called as runner(snippet, code).
+        self.magics = {
+            "memo": self.memoMagic,
+            "time": self.timeMagic,
+            "timeit": self.timeitMagic,
+            "profile": self.profileMagic,
+        }
+        self.memo = MemoCache(os.path.join(os.path.dirname(self.user.getPreferenceFile()), "memo"))
+
+        # Report settings of Profile Execution, and the profile of the last run.
+        self.profile_sort = "cumulative"
+        self.profile_limit = 30
+        self.last_profile = None
 
         pal = QtGui.QPalette()
         bgc = QtGui.QColor(35, 35, 35)
@@ -53,61 +149,25 @@ RuntimeError: The following exception was thrown while executing code from line
 
     @contextlib.contextmanager
     def redirect_stdout(self):
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
         try:
-            sys.stdout = self.stdout
-            sys.stderr = self.stdout
-            yield self.stdout
+            with self.stdout.capture():
+                yield self.stdout
         finally:
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
             self.CODE_EXECUTED.emit()
             self.user.save(self.toPlainText(), "w")
 
     @contextlib.contextmanager
-    def patch_globals(self):
-        backup = globals().copy()
-        backup_keys = set(backup.keys())
+    def track_names(self, names):
+        # Only the names the code can bind are looked at, and by identity, so
+        # the bookkeeping neither scales with the namespace nor calls __eq__.
+        before = dict((name, self.namespace.get(name, _MISSING)) for name in names)
         try:
-            for key in self.locals_added:
-                globals()[key] = self.locals_added[key]
-            for key in self.locals_removed:
-                del globals()[key]
             yield
-
         finally:
-            added = {}
-            removed = {}
-            new_keys = set(globals().keys())
-            difference = set({}).union(
-                backup_keys.difference(new_keys),
-                new_keys.difference(backup_keys)
+            self.touched = set(
+                name for name, value in before.items()
+                if self.namespace.get(name, _MISSING) is not value
             )
-            intersection = backup_keys.intersection(new_keys)
-
-            for key in intersection:
-                if backup[key] != globals()[key]:
-                    added[key] = globals()[key]
-            for key in difference:
-                if key in backup:
-                    # Removed
-                    removed[key] = backup[key]
-                elif key in self.locals_added:
-                    del self.locals_added[key]
-                elif key in globals():
-                    # Added
-                    added[key] = globals()[key]
-            self.locals_added = added
-            self.locals_removed = removed
-            for key in self.locals_added:
-                del globals()[key]
-            globals().update(backup)
-
-    @property
-    def namespace(self):
-        with self.patch_globals():
-            return globals()
 
     def executeContents(self):
         self.executeCode(self.toPlainText())
@@ -121,7 +181,6 @@ RuntimeError: The following exception was thrown while executing code from line
             except BaseException as err:
                 row = self.textCursor().blockNumber()
                 with self.redirect_stdout():
-                    import traceback
                     message = traceback.format_exception_only(type(err), err)
                     error = self.EXCEPTION_MESSAGE.format(
                         exception="\n".join(message),
@@ -132,29 +191,296 @@ RuntimeError: The following exception was thrown while executing code from line
         else:
             self.executeContents()
 
+    @property
+    def session(self):
+        """The kernel or sub-interpreter code is sent to, None to run in-process."""
+        if self.use_kernel:
+            return self.kernel
+        if self.use_subinterpreter and self.subinterpretersAvailable():
+            return self.subinterpreter
+        return None
+
+    @staticmethod
+    def subinterpretersAvailable():
+        return subinterp is not None and subinterp.available()
+
+    @property
+    def running(self):
+        return (
+            self._executing or self.executor.running or self._task is not None
+            or self.kernel.busy or (self.subinterpreter is not None and self.subinterpreter.busy)
+        )
+
+    @property
+    def awaiting(self):
+        return self._task is not None
+
     def executeCode(self, code):
-        if "del " in code:
-            code = re.sub(r"(\s*)del\s([^;\n]+)", r"\1if '\2' in locals():\n\1    del \2\n\1else:\n\1    del globals()['\2']", code)
-        with self.redirect_stdout():
-            with self.patch_globals():
-                result = ""
-                ___locals = locals().copy()
-                try:
-                    result = eval(code, globals(), globals())
-                except SyntaxError:
-                    if six.PY3:
-                        six.exec_(code)
-                    else:
-                        six.exec_(code)
-                except BaseException:
-                    raise
-
-                for key in set(locals().keys()).difference(set(___locals.keys())):
-                    if key != "_%s___locals" % self.__class__.__name__:
-                        globals()[key] = locals()[key]
-
-                if result:
-                    print(result)
+        if self.running:
+            item = self.queue.enqueue(code)
+            self.stdout.message("Code is still running, queued as #%d.\n" % item.id, "stdout")
+            return
+        self._failed = False
+        session = self.session
+        runner = None
+        magic = self.splitMagic(code)
+        if magic is not None:
+            name, arguments, body = magic
+            if name not in self.magics:
+                return self.rejectCode("Unknown magic %%%s.\n" % name)
+            if session is not None:
+                return self.rejectCode("%%%s only works when code runs in-process.\n" % name)
+            try:
+                code, runner = self.magics[name](arguments, body)
+            except ValueError as err:
+                return self.rejectCode("%%%s: %s\n" % (name, err))
+        snippet = None
+        if session is None:
+            try:
+                snippet = self.code_cache.compile(code)
+            except SyntaxError:
+                # Raised again, with the usual handling, when the code runs.
+                pass
+        if magic is not None and snippet is not None and snippet.is_async:
+            return self.rejectCode("%%%s can't run code that uses await.\n" % name)
+        if snippet is not None and snippet.is_async:
+            self.stdout.beginExecution()
+            tracking = self.track_names(snippet.names)
+            tracking.__enter__()
+            self._task = self.event_loop.run(
+                run_async(snippet, self.namespace), functools.partial(self.asyncFinished, tracking)
+            )
+            self.EXECUTION_STARTED.emit()
+            return
+        self.EXECUTION_STARTED.emit()
+        if session is not None:
+            self.stdout.beginExecution()
+            try:
+                session.execute(code)
+            except (OSError, RuntimeError) as err:
+                self.kernelFinished(None, "Unable to start the session: %s" % err)
+            return
+        if self.threaded:
+            self.executor.execute(self.runCaptured, code, runner, snippet)
+            return
+        self._executing = True
+        try:
+            with self.redirect_stdout():
+                if self.pump_events:
+                    with self.pump.installed():
+                        self.runCode(code, runner, snippet)
+                else:
+                    self.runCode(code, runner, snippet)
+        except BaseException:
+            self._failed = True
+            raise
+        finally:
+            self._executing = False
+
+    def rejectCode(self, message):
+        # Nothing ran, but it counts as a failed run: the queue only moves
+        # on once CODE_EXECUTED is emitted.
+        self._failed = True
+        self.stdout.message(message)
+        self.CODE_EXECUTED.emit()
+
+    def enqueueCode(self, code, priority=0, callback=None):
+        """Queue a submission, it runs right away when nothing else is running.
+
+        `callback` is called once the submission has run without an error.
+        """
+        item = self.queue.enqueue(code, priority, callback)
+        if not self.running:
+            QtCore.QTimer.singleShot(0, self.runQueued)
+        return item
+
+    def runQueued(self):
+        if self.running:
+            return
+        item, self._current = self._current, None
+        if item is not None and item.callback is not None and not self._failed:
+            item.callback()
+        if self._failed and len(self.queue) and not self.queue.paused:
+            self.queue.setPaused(True)
+            self.stdout.message("The last run failed, the queue is paused.\n")
+            return
+        item = self.queue.pop()
+        if item is None:
+            return
+        self._current = item
+        try:
+            self.executeCode(item.code)
+        except BaseException:
+            self._failed = True
+            self.stdout.message(traceback.format_exc())
+
+    def runCells(self, cells):
+        if self.reactive_cells:
+            cells = self.cells.dependents(self.toPlainText(), cells)
+        for cell in cells:
+            self.enqueueCode(cell.source, callback=functools.partial(self.cells.markRun, cell))
+
+    def runChangedCells(self):
+        """Run the cells edited since they last ran successfully, in buffer order."""
+        cells = self.cells.changed(self.toPlainText())
+        if not cells:
+            self.stdout.message("No cells changed since their last run.\n", "stdout")
+            return
+        self.runCells(cells)
+
+    def runCellAtCursor(self):
+        cell = self.cells.cellAt(self.toPlainText(), self.textCursor().blockNumber())
+        if cell is not None and not cell.empty:
+            self.runCells([cell])
+
+    def setReactiveCells(self, enabled):
+        self.reactive_cells = enabled
+
+    def queuePaused(self, paused):
+        if not paused:
+            self._failed = False
+            self.runQueued()
+
+    def runCode(self, code, runner=None, snippet=None):
+        if snippet is None:
+            snippet = self.code_cache.compile(code)
+        with self.track_names(snippet.names):
+            if runner is None:
+                result = snippet.run(self.namespace)
+            else:
+                result = runner(snippet, code)
+            if result is not None:
+                print(result)
+
+    @staticmethod
+    def splitMagic(code):
+        """Return (name, arguments, body) when the code starts with a magic line, else None."""
+        lines = code.lstrip("\n").split("\n", 1)
+        match = MAGIC_LINE.match(lines[0].strip())
+        if match is None:
+            return None
+        return match.group(1), match.group(2) or "", lines[1] if len(lines) > 1 else ""
+
+    def memoMagic(self, arguments, body):
+        # %memo caches what the code below it binds, across sessions.
+        code = "\n".join(filter(None, [arguments, body]))
+        return code, functools.partial(self.memo.run, namespace=self.namespace)
+
+    def timeMagic(self, arguments, body):
+        code = "\n".join(filter(None, [arguments, body]))
+        return code, lambda snippet, code: timing.time_run(snippet, self.namespace)
+
+    def timeitMagic(self, arguments, body):
+        # `%timeit [-n loops] [-r runs] statement`, or the code below the
+        # magic line.  The statement is compiled once by timeit itself.
+        number, repeat, statement = timing.parse_timeit(arguments)
+        code = "\n".join(filter(None, [statement, body]))
+
+        def runner(snippet, code):
+            timing.time_repeated(code, self.namespace, number, repeat)
+
+        return code, runner
+
+    def profileMagic(self, arguments, body):
+        sort, limit, path = profiling.parse_profile(arguments)
+
+        def runner(snippet, code):
+            result, self.last_profile = profiling.profile_run(snippet, self.namespace, sort, limit, path)
+            return result
+
+        return body, runner
+
+    def profileContents(self):
+        magic = "%%profile -s %s -l %d" % (self.profile_sort, self.profile_limit)
+        self.executeCode(magic + "\n" + self.toPlainText())
+
+    def setProfileSort(self, sort):
+        self.profile_sort = sort
+
+    def askProfileLimit(self):
+        limit, accepted = QtWidgets.QInputDialog.getInt(
+            self, "Profile Report", "Number of functions to list (0 for all):", self.profile_limit, 0, 100000
+        )
+        if accepted:
+            self.profile_limit = limit
+
+    def saveProfile(self):
+        if self.last_profile is None:
+            return
+        path = QtWidgets.QFileDialog.getSaveFileName(self, "Save Profile", "", "Profile data (*.pstats)")
+        if isinstance(path, tuple):
+            path = path[0]
+        if not path:
+            return
+        if not path.endswith(".pstats"):
+            path += ".pstats"
+        self.last_profile.dump_stats(path)
+        self.stdout.message("Profile saved to %s\n" % path, "stdout")
+
+    def asyncFinished(self, tracking, result, error, cancelled):
+        # Called from inside the task, while the loop is being stepped.
+        self._task = None
+        tracking.__exit__(None, None, None)
+        self._failed = cancelled or error is not None
+        if cancelled:
+            self.stdout.message("KeyboardInterrupt: the awaited code was cancelled\n")
+        elif error is not None:
+            message = traceback.format_exception(type(error), error, error.__traceback__)
+            self.stdout.message("".join(message))
+        elif result is not None:
+            print(result)
+        self.stdout.flush(final=True)
+        self.CODE_EXECUTED.emit()
+        self.user.save(self.toPlainText(), "w")
+
+    def runCaptured(self, code, runner=None, snippet=None):
+        # Runs on the worker thread, nothing in here may touch the widget.
+        with self.stdout.capture():
+            try:
+                self.runCode(code, runner, snippet)
+            except BaseException:
+                traceback.print_exc()
+                raise
+
+    def backgroundFinished(self, error):
+        self._failed = error is not None
+        self.CODE_EXECUTED.emit()
+        self.user.save(self.toPlainText(), "w")
+
+    def kernelOutput(self, name, text):
+        # Called from the kernel's or the sub-interpreter's reader threads.
+        self.stdout.forward(name, text)
+
+    def kernelFinished(self, request, error):
+        self._failed = error is not None
+        if error and (request is None or self.use_kernel and not self.kernel.alive):
+            self.stdout.message("%s\n" % error)
+        self.stdout.flush(final=True)
+        self.CODE_EXECUTED.emit()
+        self.user.save(self.toPlainText(), "w")
+
+    def fetchFromKernel(self, names):
+        """Bring values from the kernel's namespace into the console's."""
+        values = self.kernel.fetch(names)
+        self.namespace.update(values)
+        self.touched = set(values)
+        return values
+
+    def restartKernel(self):
+        self.kernel.restart()
+        self.stdout.message("Kernel restarted.\n")
+
+    def cancelExecution(self):
+        if self._task is not None:
+            return self._task.cancel()
+        if self.kernel.busy:
+            return self.kernel.interrupt()
+        if self.executor.running:
+            return self.executor.cancel()
+        if self._executing and self.pump_events:
+            self.pump.stop()
+            return True
+        return False
 
     @staticmethod
     def mimeTypes():
@@ -214,6 +540,25 @@ RuntimeError: The following exception was thrown while executing code from line
         menu.addSeparator()
         menu.addAction("Execute Code", self.executeContents)
         menu.addAction("Execute Selected", self.executeSelected)
+        menu.addAction("Profile Execution", self.profileContents)
+        profile_menu = menu.addMenu("Profile Report")
+        sort_group = QtWidgets.QActionGroup(profile_menu)
+        for label, sort in (("Sort by Cumulative Time", "cumulative"), ("Sort by Total Time", "total")):
+            action = profile_menu.addAction(label)
+            action.setCheckable(True)
+            action.setChecked(self.profile_sort == sort)
+            action.setActionGroup(sort_group)
+            action.triggered.connect(functools.partial(self.setProfileSort, sort))
+        profile_menu.addAction("Top Functions (%d)..." % self.profile_limit, self.askProfileLimit)
+        save = profile_menu.addAction("Save Last Profile...", self.saveProfile)
+        save.setEnabled(self.last_profile is not None)
+        menu.addAction("Run Cell", self.runCellAtCursor)
+        menu.addAction("Run Changed Cells", self.runChangedCells)
+        menu.addAction("Clear Memo Cache", self.memo.clear)
+        reactive = menu.addAction("Reactive Cells")
+        reactive.setCheckable(True)
+        reactive.setChecked(self.reactive_cells)
+        reactive.toggled.connect(self.setReactiveCells)
         return menu
 
     def contextMenuEvent(self, event):
@@ -0,0 +1,410 @@
+"""Out-of-process execution kernel.
+
+`KernelClient` starts this module as a separate Python process and talks to
+it over a multiprocessing connection, a Unix socket or a named pipe on
+Windows.  The connection only carries control messages; the kernel's
+stdout and stderr are plain pipes read by the client, so prints from C
+extensions inside the kernel come through as well.
+
+Values are brought back with `KernelClient.fetch`.  They are pickled with
+protocol 5, and large out-of-band buffers (bytes, numpy arrays and other
+buffer-protocol objects) are placed in shared memory segments instead of
+the pickle stream.  The host unpickles on top of views of those segments,
+so a result of hundreds of MB is copied once inside the kernel and never
+pushed through the pipe.  Types that rebuild themselves on top of the
+buffer, like numpy arrays, then share the memory; bytearray makes its own
+copy.
+
+Nothing in here may import Qt, the kernel process doesn't need it.
+"""
+import binascii
+import codecs
+import os
+import pickle
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+from six.moves import queue
+
+from .background import package_root, start_thread
+from .compiler import CodeCache
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+# Buffers smaller than this travel inside the pickle stream.
+SHARED_THRESHOLD = 1024 * 1024
+
+# Interpreters kernels can be started with, looked for when the console is
+# embedded in an application and sys.executable is the application.
+INTERPRETERS = ("python", "python3", "pythonw", "pypy", "pypy3", "mayapy", "hython")
+
+
+def _is_interpreter(path):
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    return name.rstrip("0123456789.") in INTERPRETERS
+
+
+def default_executable():
+    """Return the Python interpreter to start kernels with, None if none can be found."""
+    if sys.executable and _is_interpreter(sys.executable):
+        return sys.executable
+    directories = [os.path.dirname(sys.executable or ""), sys.exec_prefix, os.path.join(sys.exec_prefix, "bin")]
+    suffix = ".exe" if sys.platform == "win32" else ""
+    for directory in directories:
+        for name in INTERPRETERS:
+            path = os.path.join(directory, name + suffix)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
+    return None
+
+
+class KernelClient(object):
+    """Runs code in a separate Python process.
+
+    `on_output(stream, text)` and `on_done(request, error)` are called from
+    background threads.  `error` is None on success, otherwise a one-line
+    description; when the kernel process dies `on_done` is called for the
+    running request and the kernel is started again on the next `execute`.
+
+    `executable` is the Python interpreter the kernel runs in, by default
+    the one running the console or, inside an application, one found next
+    to it.
+    """
+    def __init__(self, on_output, on_done, executable=None, startup_timeout=10.0):
+        self.on_output = on_output
+        self.on_done = on_done
+        self.executable = executable or default_executable()
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.connection = None
+        self.request = None
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._replies = queue.Queue()
+        self._segments = []
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def busy(self):
+        return self.request is not None
+
+    def start(self):
+        if self.alive:
+            return
+        # Clean up after a kernel that died on its own.
+        self.kill()
+        if not self.executable:
+            raise RuntimeError("No Python interpreter found to run the kernel, pass kernel_executable")
+        authkey = os.urandom(16)
+        listener = Listener(authkey=authkey)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root(), env.get("PYTHONPATH")]))
+        env["PYTHONUNBUFFERED"] = "1"
+        kwargs = {}
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True
+        self.process = subprocess.Popen(
+            [self.executable, "-u", "-m", __name__, str(listener.address),
+             binascii.hexlify(authkey).decode("ascii")],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            **kwargs
+        )
+        for pipe, name in ((self.process.stdout, "stdout"), (self.process.stderr, "stderr")):
+            start_thread("QtPythonConsole-kernel", self._readPipe, pipe, name)
+
+        # Listener.accept can't time out, so wait for it on a thread.
+        accepted = []
+        thread = start_thread("QtPythonConsole-kernel", lambda: accepted.append(listener.accept()))
+        deadline = time.time() + self.startup_timeout
+        while thread.is_alive() and self.process.poll() is None and time.time() < deadline:
+            thread.join(0.05)
+        thread.join(0.05)
+        listener.close()
+        if not accepted:
+            code = self.process.poll()
+            self.kill()
+            if code is not None:
+                raise RuntimeError("The kernel interpreter %s exited with code %d before it connected"
+                                   % (self.executable, code))
+            raise RuntimeError("The kernel process didn't connect within %.0f seconds" % self.startup_timeout)
+        self.connection = accepted[0]
+        start_thread("QtPythonConsole-kernel", self._receive, self.connection, self.process)
+
+    def execute(self, source):
+        with self._lock:
+            if self.busy:
+                raise RuntimeError("The kernel is still running code")
+            self.start()
+            self._counter += 1
+            self.request = self._counter
+            self.connection.send(("execute", self.request, source))
+            return self.request
+
+    def fetch(self, names, timeout=60.0):
+        """Copy the named values out of the kernel's namespace.
+
+        Returns a dict; large buffers in the values are views of shared
+        memory, which stays mapped until nothing refers to it any more.
+        """
+        with self._lock:
+            if self.busy:
+                raise RuntimeError("The kernel is still running code")
+            if not self.alive:
+                raise RuntimeError("The kernel isn't running")
+            self._releaseSegments()
+            self._counter += 1
+            request = self._counter
+            self.connection.send(("fetch", request, list(names)))
+            while True:
+                try:
+                    reply = self._replies.get(timeout=timeout)
+                except queue.Empty:
+                    raise RuntimeError("The kernel didn't answer within %.0f seconds" % timeout)
+                if reply is None:
+                    raise RuntimeError("The kernel exited")
+                if reply[1] == request:
+                    break
+            try:
+                values = dict(
+                    (name, _load(payload, buffers, self._segments))
+                    for name, (payload, buffers) in reply[2].items()
+                )
+            finally:
+                # The kernel holds on to the segments until it hears from us.
+                self.connection.send(("release",))
+            if reply[3]:
+                raise RuntimeError(reply[3])
+            return values
+
+    def _releaseSegments(self):
+        # Segments can only be closed once no views of them are left.
+        alive = []
+        for segment in self._segments:
+            try:
+                segment.close()
+            except BufferError:
+                alive.append(segment)
+        self._segments = alive
+
+    def interrupt(self):
+        if not self.alive or not self.busy:
+            return False
+        if sys.platform == "win32":
+            self.process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            self.process.send_signal(signal.SIGINT)
+        return True
+
+    def restart(self):
+        self.kill()
+        self.start()
+
+    def kill(self):
+        process, connection = self.process, self.connection
+        if process is None:
+            return
+        # Detach first so the receiver doesn't report this as a crash.
+        self.process = self.connection = None
+        request, self.request = self.request, None
+        if connection is not None:
+            try:
+                connection.send(("shutdown",))
+                process.wait(1.0)
+            except (OSError, EOFError, subprocess.TimeoutExpired):
+                pass
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if connection is not None:
+            connection.close()
+        if request is not None:
+            self.on_done(request, "The kernel was restarted")
+
+    def _readPipe(self, pipe, name):
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        fd = pipe.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                self.on_output(name, text)
+        pipe.close()
+
+    def _receive(self, connection, process):
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            if connection is not self.connection:
+                continue
+            if message[0] == "done":
+                self.request = None
+                self.on_done(message[1], message[2])
+            elif message[0] == "value":
+                self._replies.put(message)
+        if connection is not self.connection:
+            return
+        self._replies.put(None)
+        # The kernel died on its own, the next execute starts a fresh one.
+        request, self.request = self.request, None
+        if request is not None:
+            self.on_done(request, "The kernel process exited with code %s" % process.wait())
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment with this
+        # process's resource tracker, which would unlink it at exit.
+        segment = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+def _dump(value, segments, threshold=SHARED_THRESHOLD):
+    """Pickle `value`, moving large buffers into new shared memory segments.
+
+    Returns the pickle and a list with, per out-of-band buffer, either its
+    bytes or a (segment name, size) pair.
+    """
+    if shared_memory is None:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL), []
+    if isinstance(value, (bytes, memoryview)) and len(value) >= threshold:
+        # These don't pickle out-of-band on their own, they arrive as a
+        # read-only memoryview.
+        value = pickle.PickleBuffer(value)
+    buffers = []
+
+    def callback(buffer):
+        try:
+            view = buffer.raw()
+        except BufferError:
+            return True
+        if view.nbytes < threshold:
+            buffers.append(view.tobytes())
+            return False
+        segment = shared_memory.SharedMemory(create=True, size=view.nbytes)
+        segment.buf[:view.nbytes] = view
+        segments.append(segment)
+        buffers.append((segment.name, view.nbytes))
+        return False
+
+    return pickle.dumps(value, 5, buffer_callback=callback), buffers
+
+
+def _load(payload, buffers, segments):
+    views = []
+    for buffer in buffers:
+        if isinstance(buffer, tuple):
+            segment = _attach(buffer[0])
+            segments.append(segment)
+            buffer = segment.buf[:buffer[1]]
+        views.append(buffer)
+    return pickle.loads(payload, buffers=views)
+
+
+def _release(segments):
+    # On Windows the host's handle keeps a segment alive, elsewhere its
+    # mapping survives the unlink.
+    for segment in segments:
+        segment.close()
+        segment.unlink()
+    del segments[:]
+
+
+def _fetch(namespace, names, segments):
+    values = {}
+    missing = []
+    for name in names:
+        if name not in namespace:
+            missing.append(name)
+            continue
+        try:
+            values[name] = _dump(namespace[name], segments)
+        except Exception as err:
+            missing.append("%s (%s: %s)" % (name, type(err).__name__, err))
+    error = "Can't fetch %s" % ", ".join(missing) if missing else None
+    return values, error
+
+
+def _serve(connection):
+    import asyncio
+    from .coroutines import run_async
+
+    namespace = {"__name__": "__main__"}
+    cache = CodeCache()
+    loop = asyncio.new_event_loop()
+    segments = []
+    while True:
+        try:
+            message = connection.recv()
+        except KeyboardInterrupt:
+            continue
+        except EOFError:
+            break
+        _release(segments)
+        if message[0] == "shutdown":
+            break
+        if message[0] == "fetch":
+            values, error = _fetch(namespace, message[2], segments)
+            connection.send(("value", message[1], values, error))
+            continue
+        if message[0] != "execute":
+            continue
+        request, source = message[1], message[2]
+        error = None
+        try:
+            snippet = cache.compile(source)
+            if snippet.is_async:
+                # Tasks started here only make progress while later
+                # submissions await something.
+                result = loop.run_until_complete(run_async(snippet, namespace))
+            else:
+                result = snippet.run(namespace)
+            if result is not None:
+                namespace["_"] = result
+                print(result)
+        except BaseException as err:
+            traceback.print_exc()
+            error = "".join(traceback.format_exception_only(type(err), err)).strip()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        connection.send(("done", request, error))
+    _release(segments)
+
+
+def main(argv):
+    address, authkey = argv[1], binascii.unhexlify(argv[2])
+    if sys.platform == "win32":
+        signal.signal(signal.SIGBREAK, signal.default_int_handler)
+    connection = Client(address, authkey=authkey)
+    try:
+        _serve(connection)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,268 @@
+import hashlib
+import importlib
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+import types
+
+
+def fingerprint(value, _seen=None):
+    """Return a string identifying `value` across sessions, None if there's no way to.
+
+    Buffers are hashed in place, modules and importable functions by name,
+    other functions by their code and whatever it depends on, anything
+    else through its pickle.  Sets are pickled in a canonical order, the
+    order they iterate in changes with string hashing between processes.
+    """
+    if isinstance(value, types.ModuleType):
+        return "module:%s" % value.__name__
+    if isinstance(value, types.FunctionType):
+        return _function_fingerprint(value, set() if _seen is None else _seen)
+    digest = hashlib.sha1()
+    try:
+        view = memoryview(value)
+    except TypeError:
+        pass
+    else:
+        digest.update(("%s:%s:%s:" % (type(value).__name__, view.format, view.shape)).encode("utf-8"))
+        try:
+            digest.update(view)
+        except (BufferError, ValueError):
+            digest.update(view.tobytes())
+        return "buffer:%s" % digest.hexdigest()
+    try:
+        digest.update(_canonical_pickle(_canonical(value)))
+    except Exception:
+        return None
+    return "pickle:%s" % digest.hexdigest()
+
+
+class _SortedItems(tuple):
+    """Stands in for a set while fingerprinting: its type and sorted items."""
+
+
+def _canonical_pickle(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _canonical(value):
+    # Only the builtin containers are walked, sets held by other objects
+    # still pickle in iteration order.
+    if isinstance(value, (set, frozenset)):
+        items = sorted((_canonical(item) for item in value), key=_canonical_pickle)
+        return _SortedItems([type(value).__name__] + items)
+    if type(value) in (list, tuple):
+        return type(value)(_canonical(item) for item in value)
+    if type(value) is dict:
+        return dict((_canonical(key), _canonical(item)) for key, item in value.items())
+    return value
+
+
+def _global_names(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names.update(_global_names(constant))
+    return names
+
+
+def _function_fingerprint(function, seen):
+    name = getattr(function, "__qualname__", function.__name__)
+    module = sys.modules.get(function.__module__ or "")
+    if module is not None and module.__name__ != "__main__" and getattr(module, name, None) is function:
+        return "function:%s.%s" % (module.__name__, name)
+    if id(function) in seen:
+        # Recursion, the function is already being fingerprinted.
+        return "function:recursive"
+    seen.add(id(function))
+    # The globals the code names, its closure and its defaults change
+    # what the function computes as much as the code does.
+    dependencies = [
+        (name, function.__globals__[name])
+        for name in sorted(_global_names(function.__code__)) if name in function.__globals__
+    ]
+    for index, cell in enumerate(function.__closure__ or ()):
+        try:
+            dependencies.append(("<closure %d>" % index, cell.cell_contents))
+        except ValueError:
+            # The variable hasn't been assigned yet.
+            dependencies.append(("<closure %d>" % index, None))
+    for index, default in enumerate(function.__defaults__ or ()):
+        dependencies.append(("<default %d>" % index, default))
+    for name, default in sorted((getattr(function, "__kwdefaults__", None) or {}).items()):
+        dependencies.append(("<default %s>" % name, default))
+    digest = hashlib.sha1(marshal.dumps(function.__code__))
+    for name, dependency in dependencies:
+        value = fingerprint(dependency, seen)
+        if value is None:
+            return None
+        digest.update(("\0%s=%s" % (name, value)).encode("utf-8"))
+    return "function:%s" % digest.hexdigest()
+
+
+class _ImportedModule(object):
+    """Stands in for a module in a stored entry, it's imported again on load."""
+    def __init__(self, name):
+        self.name = name
+
+
+def _stored(value):
+    if isinstance(value, types.ModuleType):
+        return _ImportedModule(value.__name__)
+    return value
+
+
+def _restored(value):
+    if isinstance(value, _ImportedModule):
+        return importlib.import_module(value.name)
+    return value
+
+
+try:
+    _replace = os.replace
+except AttributeError:
+    def _replace(source, destination):
+        # Python 2: renaming onto an existing file fails on Windows.
+        if sys.platform == "win32" and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+class MemoCache(object):
+    """Results of expensive snippets, pickled to a directory.
+
+    An entry is keyed by the source of the snippet and fingerprints of the
+    namespace values it reads, and holds the values of the names it binds
+    plus its displayed result; modules among them are stored by name and
+    imported again.  What the snippet printed isn't kept.  Once the
+    directory grows past `max_bytes` the least recently used entries are
+    deleted.
+    """
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, "%s.pickle" % key)
+
+    def key(self, snippet, source, namespace):
+        """Return the entry key for running `source`, compiled to `snippet`, in `namespace`.
+
+        Only the names the snippet may read before binding them count.
+        Raises ValueError when one of their values can't be fingerprinted.
+        """
+        digest = hashlib.sha1(source.encode("utf-8"))
+        for name in sorted(snippet.used):
+            if name not in namespace or name == "__builtins__":
+                continue
+            value = fingerprint(namespace[name])
+            if value is None:
+                raise ValueError("%r can't be fingerprinted" % name)
+            digest.update(("\0%s=%s" % (name, value)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            fh = open(path, "rb")
+        except (IOError, OSError):
+            return None
+        try:
+            with fh:
+                entry = pickle.load(fh)
+            entry["names"] = dict((name, _restored(value)) for name, value in entry["names"].items())
+        except Exception:
+            # Truncated, or referring to classes or modules that are gone:
+            # a miss, and an entry that's never going to load.
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # The modification time is the recency used for eviction.
+        os.utime(path, None)
+        return entry
+
+    def store(self, key, entry):
+        data = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return False
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as fh:
+                fh.write(data)
+            _replace(temporary, self.path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+        return True
+
+    def entries(self):
+        """Return (modification time, size, path) of every entry, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pickle"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, snippet, source, namespace):
+        """Run a compiled snippet, or restore what it bound from an earlier run."""
+        try:
+            key = self.key(snippet, source, namespace)
+        except ValueError as err:
+            sys.stderr.write("%%memo: not cached, %s\n" % err)
+            return snippet.run(namespace)
+        entry = self.load(key)
+        if entry is not None:
+            self.hits += 1
+            namespace.update(entry["names"])
+            return entry["result"]
+        self.misses += 1
+        result = snippet.run(namespace)
+        entry = {
+            "names": dict((name, _stored(namespace[name])) for name in snippet.names if name in namespace),
+            "result": result,
+        }
+        try:
+            if not self.store(key, entry):
+                sys.stderr.write("%memo: not cached, the result is larger than the cache\n")
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            sys.stderr.write("%%memo: not cached, %s\n" % err)
+        return result
@@ -1,13 +1,36 @@
-from six.moves import cStringIO as StringIO
+import bisect
+import time
 
-from Qt import QtGui
+from Qt import QtCore, QtGui, QtWidgets
+from .chunks import ChunkTable, STDERR
+from .scrollback import Scrollback
+from .search import LineFilter
+from .spool import SpoolFile
+from .stream import OutputRouter
 from .textedit import TextEdit
 
+STDERR_COLOR = QtGui.QColor(230, 110, 110)
+ELISION = u" \u2026 [line elided]"
+ELIDED = 1
+
 
 class OutputConsole(TextEdit):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, max_lines=100000, max_bytes=32 * 1024 * 1024, max_line_length=5000):
         super(OutputConsole, self).__init__(parent)
-        self.stdin = StringIO()
+        self.max_line_length = max_line_length
+        self._menu_block = None
+        self.stdin = OutputRouter(self)
+        self.stdin.written.connect(self.appendChunks)
+        self.destroyed.connect(self.stdin.uninstall)
+        self.scrollback = Scrollback(max_lines=max_lines, max_bytes=max_bytes)
+        self.filter = LineFilter(self.scrollback)
+        self.chunks = ChunkTable()
+        self.stdout_format = QtGui.QTextCharFormat()
+        self.stderr_format = QtGui.QTextCharFormat()
+        self.stderr_format.setForeground(STDERR_COLOR)
+        self.elision_format = QtGui.QTextCharFormat()
+        self.elision_format.setFontItalic(True)
+        self.elision_format.setForeground(QtGui.QColor(120, 120, 120))
         self.setReadOnly(True)
         font = QtGui.QFont('courier', 9)
         self.setFont(font)
@@ -19,18 +42,400 @@ class OutputConsole(TextEdit):
         self.setPalette(pal)
 
     def read_stdin(self):
-        value = self.stdin.getvalue()
-        value = value.replace("\0", "")
-        self.document().setPlainText(value)
+        # Output is streamed in while the code runs, push out whatever is
+        # still buffered and jump to the end.
+        self.stdin.flush()
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    def appendOutput(self, text, stream="stdout"):
+        self.appendChunks([(stream, self.stdin.execution, time.time(), text)])
+
+    def appendChunks(self, chunks):
+        scrollbar = self.verticalScrollBar()
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+        cursor = QtGui.QTextCursor(self.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        evicted = 0
+        for stream, execution, timestamp, text in chunks:
+            self.chunks.append(self.lastLine(), stream, execution, timestamp)
+            evicted += self.scrollback.append(text)
+            if not self.filter.active:
+                self.insertText(cursor, text, self.stderr_format if stream == "stderr" else self.stdout_format)
+        self.chunks.trim(self.scrollback.first_line)
+        if self.filter.active:
+            evicted, found = self.filter.update()
+            for number in found:
+                if not self.document().isEmpty():
+                    cursor.insertText("\n", self.stdout_format)
+                self.insertText(cursor, self.scrollback.line(number), self.lineFormat(number))
+        self.removeLeadingBlocks(evicted)
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def insertText(self, cursor, text, char_format):
+        # Laying out a single huge line is what makes the pane crawl, so
+        # anything past max_line_length only lives in the scrollback until
+        # the user expands it.
+        limit = self.max_line_length
+        block = cursor.block()
+        if not limit or (len(text) + block.length() <= limit and block.userState() != ELIDED):
+            cursor.insertText(text, char_format)
+            return
+        for index, piece in enumerate(text.split("\n")):
+            if index:
+                cursor.insertText("\n", char_format)
+                block = cursor.block()
+            if block.userState() == ELIDED:
+                continue
+            room = limit - (block.length() - 1)
+            if len(piece) <= room:
+                cursor.insertText(piece, char_format)
+                continue
+            cursor.insertText(piece[:max(room, 0)], char_format)
+            cursor.insertText(ELISION, self.elision_format)
+            block.setUserState(ELIDED)
+
+    def lastLine(self):
+        return self.scrollback.first_line + len(self.scrollback) - 1
+
+    def lineFormat(self, number):
+        if self.chunks.stream(number) == STDERR:
+            return self.stderr_format
+        return self.stdout_format
+
+    def blockForLine(self, number):
+        if self.filter.active:
+            return bisect.bisect_left(self.filter.matches, number)
+        return number - self.scrollback.first_line
+
+    def lineForBlock(self, block):
+        if self.filter.active:
+            if block >= len(self.filter.matches):
+                return None
+            return self.filter.matches[block]
+        return block + self.scrollback.first_line
+
+    def removeLeadingBlocks(self, count):
+        if count <= 0:
+            return
+        if count >= self.document().blockCount():
+            self.document().setPlainText("")
+            return
+        cursor = QtGui.QTextCursor(self.document())
+        cursor.movePosition(QtGui.QTextCursor.Start)
+        cursor.movePosition(QtGui.QTextCursor.NextBlock, QtGui.QTextCursor.KeepAnchor, count)
+        cursor.removeSelectedText()
+
+    def setScrollbackLimits(self, max_lines=None, max_bytes=None):
+        evicted = self.scrollback.setLimits(max_lines, max_bytes)
+        if self.filter.active:
+            evicted = self.filter.update()[0]
+        self.removeLeadingBlocks(evicted)
+
+    def setFilter(self, pattern, regex=False, case_sensitive=False):
+        self.filter.setPattern(pattern, regex=regex, case_sensitive=case_sensitive)
+        self.refresh()
+
+    def refresh(self):
+        if self.filter.active:
+            line = self.scrollback.line
+            text = "\n".join(line(number) for number in self.filter.matches)
+            stderr = [(number, number + 1) for number in self.filter.matches if self.chunks.stream(number) == STDERR]
+        else:
+            text = self.scrollback.text()
+            stderr = self.chunks.ranges(stream=STDERR)
+        self.document().setPlainText(text)
+        for first, end in stderr:
+            self.formatLines(first, end, self.stderr_format)
+        self.elideLongBlocks()
         self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
 
+    def elideLongBlocks(self):
+        limit = self.max_line_length
+        if not limit:
+            return
+        document = self.document()
+        block = document.firstBlock()
+        while block.isValid():
+            if block.length() - 1 > limit:
+                cursor = QtGui.QTextCursor(block)
+                cursor.setPosition(block.position() + limit)
+                cursor.movePosition(QtGui.QTextCursor.EndOfBlock, QtGui.QTextCursor.KeepAnchor)
+                cursor.insertText(ELISION, self.elision_format)
+                block.setUserState(ELIDED)
+            block = block.next()
+
+    def expandLine(self, block=None):
+        if block is None:
+            block = self.textCursor().block()
+        if not block.isValid() or block.userState() != ELIDED:
+            return False
+        number = self.lineForBlock(block.blockNumber())
+        if number is None:
+            return False
+        cursor = QtGui.QTextCursor(block)
+        cursor.movePosition(QtGui.QTextCursor.EndOfBlock, QtGui.QTextCursor.KeepAnchor)
+        cursor.insertText(self.scrollback.line(number), self.lineFormat(number))
+        block.setUserState(-1)
+        return True
+
+    def formatLines(self, first, end, char_format):
+        document = self.document()
+        block = document.findBlockByNumber(max(self.blockForLine(first), 0))
+        if end is None:
+            last = document.lastBlock()
+        else:
+            last = document.findBlockByNumber(self.blockForLine(end) - 1)
+        if not block.isValid() or not last.isValid() or last.blockNumber() < block.blockNumber():
+            return
+        cursor = QtGui.QTextCursor(block)
+        cursor.setPosition(last.position() + last.length() - 1, QtGui.QTextCursor.KeepAnchor)
+        cursor.setCharFormat(char_format)
+
+    def scrollToExecution(self, execution):
+        line = self.chunks.firstLine(execution)
+        if line is None:
+            return False
+        block = self.document().findBlockByNumber(self.blockForLine(line))
+        if not block.isValid():
+            return False
+        # Going via the end puts the block at the top of the viewport.
+        self.moveCursor(QtGui.QTextCursor.End)
+        self.setTextCursor(QtGui.QTextCursor(block))
+        self.ensureCursorVisible()
+        return True
+
+    def executionAtCursor(self):
+        line = self.lineForBlock(self.textCursor().blockNumber())
+        if line is None:
+            return 0
+        return self.chunks.execution(line)
+
+    def setExecutionFolded(self, execution, folded=True):
+        if self.filter.active:
+            return
+        document = self.document()
+        for first, end in self.chunks.ranges(execution=execution):
+            if end is None:
+                end = self.lastLine() + 1
+            block = document.findBlockByNumber(max(self.blockForLine(first), 0))
+            for _ in range(max(self.blockForLine(end) - block.blockNumber(), 0)):
+                if not block.isValid():
+                    break
+                block.setVisible(not folded)
+                block = block.next()
+        document.markContentsDirty(0, document.characterCount())
+        self.viewport().update()
+
+    def unfoldAll(self):
+        document = self.document()
+        block = document.firstBlock()
+        while block.isValid():
+            block.setVisible(True)
+            block = block.next()
+        document.markContentsDirty(0, document.characterCount())
+        self.viewport().update()
+
+    def foldExecutionAtCursor(self):
+        execution = self.executionAtCursor()
+        if execution:
+            self.setExecutionFolded(execution)
+
+    def jumpToExecution(self):
+        execution, ok = QtWidgets.QInputDialog.getInt(
+            self, "Jump to Run", "Run:", self.stdin.execution, 1, max(self.stdin.execution, 1)
+        )
+        if ok:
+            self.scrollToExecution(execution)
+
     def clear(self):
-        self.stdin.truncate(0)
+        self.scrollback.clear()
+        self.chunks.clear()
+        self.filter.rescan()
         self.document().setPlainText("")
 
     def createStandardContextMenu(self):
         menu = super(TextEdit, self).createStandardContextMenu()
         menu.addSeparator()
+        block = self._menu_block if self._menu_block is not None else self.textCursor().block()
+        expand = menu.addAction("Expand Line", lambda: self.expandLine(block))
+        expand.setEnabled(block.userState() == ELIDED)
+        menu.addAction("Jump to Run...", self.jumpToExecution)
+        fold = menu.addAction("Fold Run", self.foldExecutionAtCursor)
+        unfold = menu.addAction("Unfold All Runs", self.unfoldAll)
+        fold.setEnabled(not self.filter.active)
+        unfold.setEnabled(not self.filter.active)
+        menu.addSeparator()
+        menu.addAction("Clear...", self.clear)
+        return menu
+
+    def contextMenuEvent(self, event):
+        self._menu_block = self.cursorForPosition(event.pos()).block()
+        try:
+            menu = self.createStandardContextMenu()
+        finally:
+            self._menu_block = None
+        menu.exec_(self.mapToGlobal(event.pos()))
+
+
+class SpoolModel(QtCore.QAbstractListModel):
+    def __init__(self, spool, parent=None, max_line_length=5000):
+        super(SpoolModel, self).__init__(parent)
+        self.spool = spool
+        self.max_line_length = max_line_length
+        self.filter = LineFilter(spool)
+        self.chunks = ChunkTable()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.filter.active:
+            return len(self.filter.matches)
+        return len(self.spool)
+
+    def lineNumber(self, row):
+        if self.filter.active:
+            return self.filter.matches[row]
+        return row
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            number = self.lineNumber(index.row())
+            if not self.max_line_length:
+                return self.spool.line(number)
+            # Only read as much of a huge line as can be shown.
+            start, end = self.spool.lineSpan(number)
+            if end - start <= self.max_line_length:
+                return self.spool.line(number)
+            return self.spool.line(number, self.max_line_length) + ELISION
+        if role == QtCore.Qt.ForegroundRole:
+            if self.chunks.stream(self.lineNumber(index.row())) == STDERR:
+                return QtGui.QBrush(STDERR_COLOR)
+        return None
+
+    def rowForLine(self, number):
+        if self.filter.active:
+            return bisect.bisect_left(self.filter.matches, number)
+        return number
+
+    def appendChunks(self, chunks):
+        for stream, execution, timestamp, text in chunks:
+            self.chunks.append(len(self.spool) - 1, stream, execution, timestamp)
+            self.appendText(text)
+
+    def appendText(self, text):
+        if self.filter.active:
+            self.spool.append(text)
+            rows = len(self.filter.matches)
+            found = self.filter.update()[1]
+            if found:
+                self.beginInsertRows(QtCore.QModelIndex(), rows, rows + len(found) - 1)
+                self.endInsertRows()
+            return
+        last = len(self.spool) - 1
+        rows = len(self.spool)
+        added = self.spool.append(text)
+        if added:
+            self.beginInsertRows(QtCore.QModelIndex(), rows, rows + added - 1)
+            self.endInsertRows()
+        # The last line was still open and may have grown.
+        self.dataChanged.emit(self.index(last), self.index(last))
+
+    def setFilter(self, pattern, regex=False, case_sensitive=False):
+        self.beginResetModel()
+        try:
+            self.filter.setPattern(pattern, regex=regex, case_sensitive=case_sensitive)
+        finally:
+            self.endResetModel()
+
+    def clear(self):
+        self.beginResetModel()
+        self.spool.clear()
+        self.chunks.clear()
+        self.filter.rescan()
+        self.endResetModel()
+
+
+class SpooledOutputConsole(QtWidgets.QListView):
+    """Output pane that spills everything to disk and only reads visible lines."""
+    def __init__(self, parent=None, directory=None, max_line_length=5000):
+        super(SpooledOutputConsole, self).__init__(parent)
+        self.stdin = OutputRouter(self)
+        self.stdin.written.connect(self.appendChunks)
+        self.destroyed.connect(self.stdin.uninstall)
+        self.spool = SpoolFile(directory=directory)
+        self.setModel(SpoolModel(self.spool, self, max_line_length=max_line_length))
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
+        font = QtGui.QFont('courier', 9)
+        self.setFont(font)
+        pal = QtGui.QPalette()
+        bgc = QtGui.QColor(50, 50, 50)
+        pal.setColor(QtGui.QPalette.Base, bgc)
+        text_color = QtGui.QColor(175, 175, 175)
+        pal.setColor(QtGui.QPalette.Text, text_color)
+        self.setPalette(pal)
+
+    def read_stdin(self):
+        self.stdin.flush()
+        self.scrollToBottom()
+
+    def appendOutput(self, text, stream="stdout"):
+        self.appendChunks([(stream, self.stdin.execution, time.time(), text)])
+
+    def appendChunks(self, chunks):
+        scrollbar = self.verticalScrollBar()
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+        self.model().appendChunks(chunks)
+        if at_bottom:
+            self.scrollToBottom()
+
+    def scrollToExecution(self, execution):
+        model = self.model()
+        line = model.chunks.firstLine(execution)
+        if line is None:
+            return False
+        row = model.rowForLine(line)
+        if row >= model.rowCount():
+            return False
+        self.scrollTo(model.index(row), QtWidgets.QAbstractItemView.PositionAtTop)
+        return True
+
+    def jumpToExecution(self):
+        execution, ok = QtWidgets.QInputDialog.getInt(
+            self, "Jump to Run", "Run:", self.stdin.execution, 1, max(self.stdin.execution, 1)
+        )
+        if ok:
+            self.scrollToExecution(execution)
+
+    def clear(self):
+        self.model().clear()
+
+    def setFilter(self, pattern, regex=False, case_sensitive=False):
+        self.model().setFilter(pattern, regex=regex, case_sensitive=case_sensitive)
+        self.scrollToBottom()
+
+    def copySelected(self):
+        model = self.model()
+        rows = sorted(index.row() for index in self.selectedIndexes())
+        text = "\n".join(self.spool.line(model.lineNumber(row)) for row in rows)
+        QtWidgets.QApplication.clipboard().setText(text)
+
+    def keyPressEvent(self, e):
+        if e.matches(QtGui.QKeySequence.Copy):
+            self.copySelected()
+            e.accept()
+            return
+        return super(SpooledOutputConsole, self).keyPressEvent(e)
+
+    def createStandardContextMenu(self):
+        menu = QtWidgets.QMenu("ContextMenu")
+        menu.addAction("Copy", self.copySelected)
+        menu.addAction("Jump to Run...", self.jumpToExecution)
+        menu.addSeparator()
         menu.addAction("Clear...", self.clear)
         return menu
 
@@ -0,0 +1,66 @@
+import cProfile
+import getopt
+import pstats
+import shlex
+import sys
+
+# Report orders offered in the console, mapped to pstats sort keys.
+SORT_KEYS = {
+    "cumulative": "cumulative",
+    "total": "tottime",
+    "calls": "ncalls",
+}
+
+
+def parse_profile(arguments):
+    """Parse `[-s cumulative|total|calls] [-l top] [-o file.pstats]` into (sort, limit, path)."""
+    try:
+        options, rest = getopt.getopt(shlex.split(arguments), "s:l:o:")
+    except getopt.GetoptError as err:
+        raise ValueError(str(err))
+    if rest:
+        raise ValueError("the code to profile goes on the lines below the magic")
+    sort, limit, path = "cumulative", 30, None
+    for option, value in options:
+        if option == "-s":
+            if value not in SORT_KEYS:
+                raise ValueError("sort by one of %s" % ", ".join(sorted(SORT_KEYS)))
+            sort = value
+        elif option == "-l":
+            limit = int(value)
+        else:
+            path = value
+    return sort, limit, path
+
+
+def profile_run(snippet, namespace, sort="cumulative", limit=30, path=None):
+    """Run a compiled snippet under cProfile and print the hottest functions.
+
+    Returns (result, profile).  cProfile takes the thread's profile hook,
+    so the event pump is suspended while the snippet runs and reinstated
+    afterwards.
+    """
+    previous = sys.getprofile()
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        result = snippet.run(namespace)
+    finally:
+        profile.disable()
+        try:
+            print_profile(profile, sort, limit)
+            if path:
+                profile.dump_stats(path)
+                print("Profile saved to %s" % path)
+        finally:
+            # Collecting the stats disables the profile again, which
+            # clears whatever hook is installed by then.
+            sys.setprofile(previous)
+    return result, profile
+
+
+def print_profile(profile, sort="cumulative", limit=30):
+    stats = pstats.Stats(profile, stream=sys.stdout)
+    stats.strip_dirs()
+    stats.sort_stats(SORT_KEYS[sort])
+    stats.print_stats(limit or None)
@@ -0,0 +1,189 @@
+import bisect
+import itertools
+
+from Qt import QtCore, QtGui, QtWidgets
+
+
+class QueuedSnippet(object):
+    __slots__ = ("id", "code", "priority", "sequence", "callback")
+
+    def __init__(self, id, code, priority, sequence, callback=None):
+        self.id = id
+        self.code = code
+        self.priority = priority
+        self.sequence = sequence
+        # Called once the snippet has run without an error.
+        self.callback = callback
+
+    @property
+    def key(self):
+        # Higher priorities first, equal ones in submission order.
+        return (-self.priority, self.sequence)
+
+    @property
+    def title(self):
+        for line in self.code.splitlines():
+            if line.strip():
+                return line.strip()
+        return ""
+
+
+class ExecutionQueue(QtCore.QAbstractListModel):
+    """Submissions waiting for the running code to finish, in execution order.
+
+    The queue is kept sorted on (priority, submission order); it's expected
+    to hold a handful of snippets, so insertion and removal are plain list
+    operations.  A paused queue keeps its items but `pop` returns None.
+    """
+    pausedChanged = QtCore.Signal(bool)
+
+    def __init__(self, parent=None):
+        super(ExecutionQueue, self).__init__(parent)
+        self._items = []
+        self._keys = []
+        self._ids = itertools.count(1)
+        self.paused = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._items)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self._items[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            if item.priority:
+                return "#%d [%+d] %s" % (item.id, item.priority, item.title)
+            return "#%d %s" % (item.id, item.title)
+        if role == QtCore.Qt.ToolTipRole:
+            return item.code
+        if role == QtCore.Qt.ForegroundRole and self.paused:
+            return QtGui.QBrush(QtGui.QColor(120, 120, 120))
+        return None
+
+    def item(self, row):
+        return self._items[row]
+
+    def enqueue(self, code, priority=0, callback=None):
+        item_id = next(self._ids)
+        item = QueuedSnippet(item_id, code, priority, item_id, callback)
+        row = bisect.bisect_right(self._keys, item.key)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self._items.insert(row, item)
+        self._keys.insert(row, item.key)
+        self.endInsertRows()
+        return item
+
+    def _remove(self, row):
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        item = self._items.pop(row)
+        del self._keys[row]
+        self.endRemoveRows()
+        return item
+
+    def _row(self, item_id):
+        for row, item in enumerate(self._items):
+            if item.id == item_id:
+                return row
+        return None
+
+    def cancel(self, item_id):
+        row = self._row(item_id)
+        if row is None:
+            return None
+        return self._remove(row)
+
+    def setPriority(self, item_id, priority):
+        item = self.cancel(item_id)
+        if item is None:
+            return None
+        item.priority = priority
+        row = bisect.bisect_right(self._keys, item.key)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self._items.insert(row, item)
+        self._keys.insert(row, item.key)
+        self.endInsertRows()
+        return item
+
+    def moveToFront(self, item_id):
+        top = self._items[0].priority if self._items else 0
+        return self.setPriority(item_id, top + 1)
+
+    def pop(self):
+        if self.paused or not self._items:
+            return None
+        return self._remove(0)
+
+    def setPaused(self, paused):
+        if paused == self.paused:
+            return
+        self.paused = paused
+        if self._items:
+            self.dataChanged.emit(self.index(0), self.index(len(self._items) - 1))
+        self.pausedChanged.emit(paused)
+
+    def clear(self):
+        self.beginResetModel()
+        del self._items[:]
+        del self._keys[:]
+        self.endResetModel()
+
+
+class QueuePanel(QtWidgets.QWidget):
+    """Small list of queued submissions with buttons to manage them."""
+    def __init__(self, queue, parent=None):
+        super(QueuePanel, self).__init__(parent)
+        self.queue = queue
+        self.view = QtWidgets.QListView()
+        self.view.setModel(queue)
+        self.view.setMaximumHeight(120)
+        self.view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.front_button = QtWidgets.QPushButton("Run Next")
+        self.pause_button = QtWidgets.QPushButton("Pause")
+        self.pause_button.setCheckable(True)
+        self.clear_button = QtWidgets.QPushButton("Clear Queue")
+
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.setContentsMargins(0, 0, 0, 0)
+        buttons.addWidget(self.cancel_button)
+        buttons.addWidget(self.front_button)
+        buttons.addStretch(1)
+        buttons.addWidget(self.pause_button)
+        buttons.addWidget(self.clear_button)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(QtWidgets.QLabel("Queued"))
+        layout.addWidget(self.view)
+        layout.addLayout(buttons)
+
+        self.cancel_button.clicked.connect(self.cancelSelected)
+        self.front_button.clicked.connect(self.moveSelectedToFront)
+        self.pause_button.toggled.connect(queue.setPaused)
+        self.clear_button.clicked.connect(queue.clear)
+        queue.pausedChanged.connect(self.pause_button.setChecked)
+        queue.rowsInserted.connect(self.updateVisibility)
+        queue.rowsRemoved.connect(self.updateVisibility)
+        queue.modelReset.connect(self.updateVisibility)
+        self.updateVisibility()
+
+    def selectedIds(self):
+        rows = sorted(index.row() for index in self.view.selectionModel().selectedRows())
+        return [self.queue.item(row).id for row in rows]
+
+    def cancelSelected(self):
+        for item_id in self.selectedIds():
+            self.queue.cancel(item_id)
+
+    def moveSelectedToFront(self):
+        for item_id in reversed(self.selectedIds()):
+            self.queue.moveToFront(item_id)
+
+    def updateVisibility(self):
+        self.setVisible(len(self.queue) > 0)
@@ -0,0 +1,99 @@
+def _encoded_size(text):
+    return len(text.encode("utf-8", "surrogatepass"))
+
+
+class Scrollback(object):
+    """Bounded store of output lines that evicts the oldest output first.
+
+    Lines are kept the same way a QTextDocument keeps its blocks: the text is
+    split on newlines and the last entry is the line currently being written,
+    so the number of stored lines always matches the document's block count.
+    Sizes are measured in bytes of the UTF-8 encoded text.
+
+    The output pane keeps its own copy of every line in the document, the
+    scrollback is what filtering, re-rendering and expanding elided lines
+    read from.  Both copies are bounded by the same limits.
+    """
+    def __init__(self, max_lines=100000, max_bytes=32 * 1024 * 1024):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.dropped_lines = 0
+        self.dropped_bytes = 0
+        self._lines = [""]
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return len(self._lines) - self._start
+
+    def __iter__(self):
+        for index in range(self._start, len(self._lines)):
+            yield self._lines[index]
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def first_line(self):
+        """Absolute number of the oldest line still held."""
+        return self.dropped_lines
+
+    def line(self, number):
+        """Return a line by its absolute number, counted from the last clear."""
+        index = number - self.dropped_lines
+        if index < 0 or index >= len(self):
+            raise IndexError(number)
+        return self._lines[self._start + index]
+
+    def search(self, expression, start, end):
+        """Return the numbers of lines in [start, end) matched by a compiled expression."""
+        search = expression.search
+        first = self.dropped_lines
+        offset = self._start - first
+        lines = self._lines
+        start = max(start, first)
+        end = min(end, first + len(self))
+        return [number for number in range(start, end) if search(lines[number + offset])]
+
+    def text(self):
+        return "\n".join(self)
+
+    def append(self, text):
+        """Append text and return the number of lines evicted from the front."""
+        pieces = text.split("\n")
+        self._lines[-1] += pieces[0]
+        self._lines.extend(pieces[1:])
+        self._size += _encoded_size(text)
+        return self.trim()
+
+    def setLimits(self, max_lines=None, max_bytes=None):
+        if max_lines is not None:
+            self.max_lines = max_lines
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        return self.trim()
+
+    def trim(self):
+        evicted = 0
+        while len(self) > 1 and (len(self) > self.max_lines or self._size > self.max_bytes):
+            line = self._lines[self._start]
+            self._lines[self._start] = None
+            self._start += 1
+            size = _encoded_size(line) + 1
+            self._size -= size
+            self.dropped_bytes += size
+            evicted += 1
+        self.dropped_lines += evicted
+        if self._start > 4096 and self._start * 2 > len(self._lines):
+            # Compact once the evicted slots make up most of the list.
+            del self._lines[:self._start]
+            self._start = 0
+        return evicted
+
+    def clear(self):
+        self._lines = [""]
+        self._start = 0
+        self._size = 0
+        self.dropped_lines = 0
+        self.dropped_bytes = 0
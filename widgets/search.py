@@ -0,0 +1,100 @@
+import bisect
+import re
+
+
+class LineFilter(object):
+    """Incremental line filter over an output store.
+
+    The source must provide `first_line`, `len()`, `line(number)` and
+    `search(expression, start, end)`.  Matches are kept as absolute line
+    numbers; lines appended to the source are scanned once when `update` is
+    called and a substring that extends the previous one only re-tests the
+    previous matches.  The last line of the source is still being written,
+    so it is only scanned once it has been terminated.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.pattern = ""
+        self.regex = False
+        self.case_sensitive = False
+        self.matches = []
+        self._expression = None
+        self._scanned = 0
+
+    @property
+    def active(self):
+        return self._expression is not None
+
+    def setPattern(self, pattern, regex=False, case_sensitive=False):
+        """Filter on a substring or regular expression, an empty pattern disables the filter.
+
+        Raises re.error for an invalid regular expression and leaves the
+        current filter untouched.
+        """
+        if not pattern:
+            self.reset()
+            return
+        flags = 0 if case_sensitive else re.IGNORECASE
+        expression = re.compile(pattern if regex else re.escape(pattern), flags)
+        narrow = (
+            self.active
+            and not regex and not self.regex
+            and case_sensitive == self.case_sensitive
+            and self._contains(pattern, self.pattern, case_sensitive)
+        )
+        self.pattern = pattern
+        self.regex = regex
+        self.case_sensitive = case_sensitive
+        self._expression = expression
+        if narrow:
+            self._dropEvicted()
+            search = expression.search
+            line = self.source.line
+            self.matches = [number for number in self.matches if search(line(number))]
+            self.update()
+        else:
+            self.rescan()
+
+    def rescan(self):
+        """Drop all matches and scan the whole source again, e.g. after it was cleared."""
+        self.matches = []
+        self._scanned = self.source.first_line
+        self.update()
+
+    @staticmethod
+    def _contains(pattern, previous, case_sensitive):
+        if case_sensitive:
+            return previous in pattern
+        return previous.lower() in pattern.lower()
+
+    def update(self):
+        """Scan newly completed lines.
+
+        Returns the number of matches dropped from the front because the
+        source evicted them, and the list of new matches.
+        """
+        if not self.active:
+            return 0, []
+        dropped = self._dropEvicted()
+        first = self.source.first_line
+        end = first + len(self.source) - 1
+        start = max(self._scanned, first)
+        if start >= end:
+            return dropped, []
+        found = self.source.search(self._expression, start, end)
+        self._scanned = end
+        self.matches.extend(found)
+        return dropped, found
+
+    def _dropEvicted(self):
+        count = bisect.bisect_left(self.matches, self.source.first_line)
+        if count:
+            del self.matches[:count]
+        return count
+
+    def reset(self):
+        self.pattern = ""
+        self.regex = False
+        self._expression = None
+        self.matches = []
+        self._scanned = 0
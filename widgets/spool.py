@@ -0,0 +1,132 @@
+import array
+import bisect
+import mmap
+import re
+import tempfile
+
+try:
+    _OFFSETS_TYPE = "Q"
+    array.array(_OFFSETS_TYPE)
+except ValueError:
+    _OFFSETS_TYPE = "L"
+
+
+class SpoolFile(object):
+    """Append-only output log kept in a temporary file.
+
+    Only the start offset of every line is held in memory, lines are read
+    back on demand from a read-only memory map of the file.
+    """
+    def __init__(self, directory=None, encoding="utf-8"):
+        self.encoding = encoding
+        self._fh = tempfile.TemporaryFile(prefix="QtPythonConsole-", suffix=".log", dir=directory)
+        self._offsets = array.array(_OFFSETS_TYPE, [0])
+        self._size = 0
+        self._map = None
+        self._mapped = 0
+        self._expressions = {}
+
+    def __len__(self):
+        return len(self._offsets)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def first_line(self):
+        return 0
+
+    def append(self, text):
+        """Write text to the end of the log and return the number of lines it started."""
+        data = text.encode(self.encoding, "replace")
+        if not data:
+            return 0
+        self._fh.seek(0, 2)
+        self._fh.write(data)
+        lines = len(self._offsets)
+        start = data.find(b"\n")
+        while start != -1:
+            self._offsets.append(self._size + start + 1)
+            start = data.find(b"\n", start + 1)
+        self._size += len(data)
+        return len(self._offsets) - lines
+
+    def lineSpan(self, number):
+        if number < 0 or number >= len(self._offsets):
+            raise IndexError(number)
+        start = self._offsets[number]
+        if number + 1 < len(self._offsets):
+            return start, self._offsets[number + 1] - 1
+        return start, self._size
+
+    def line(self, number, limit=None):
+        """Return a line, or just its first `limit` bytes."""
+        start, end = self.lineSpan(number)
+        if limit is not None:
+            end = min(end, start + limit)
+        if start == end:
+            return u""
+        return self.view()[start:end].decode(self.encoding, "replace")
+
+    def search(self, expression, start, end):
+        """Return the numbers of lines in [start, end) matched by a compiled expression.
+
+        The expression is re-compiled as a bytes pattern and run straight over
+        the memory map, so the scan itself never leaves C.
+        """
+        end = min(end, len(self._offsets))
+        if start >= end:
+            return []
+        expression = self._bytesExpression(expression)
+        offsets = self._offsets
+        pos = offsets[start]
+        endpos = offsets[end] - 1 if end < len(offsets) else self._size
+        view = self.view()
+        matches = []
+        while pos <= endpos:
+            match = expression.search(view, pos, endpos)
+            if match is None:
+                break
+            number = bisect.bisect_right(offsets, match.start()) - 1
+            matches.append(number)
+            if number + 1 >= len(offsets):
+                break
+            # Carry on from the next line, one hit per line is enough.
+            pos = offsets[number + 1]
+        return matches
+
+    def _bytesExpression(self, expression):
+        key = (expression.pattern, expression.flags)
+        if key not in self._expressions:
+            flags = expression.flags & ~re.UNICODE
+            self._expressions[key] = re.compile(expression.pattern.encode(self.encoding), flags | re.MULTILINE)
+        return self._expressions[key]
+
+    def view(self):
+        """Return a memory map covering everything written so far."""
+        if not self._size:
+            return b""
+        if self._map is None or self._mapped < self._size:
+            self._fh.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped = self._size
+        return self._map
+
+    def clear(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._mapped = 0
+        self._fh.seek(0)
+        self._fh.truncate()
+        self._offsets = array.array(_OFFSETS_TYPE, [0])
+        self._size = 0
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._fh.close()
@@ -0,0 +1,500 @@
+import codecs
+import collections
+import contextlib
+import ctypes
+import io
+import os
+import sys
+import threading
+import time
+
+from Qt import QtCore
+
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident
+
+
+class RoutedStream(object):
+    """Replacement for sys.stdout/sys.stderr that hands writes to an OutputRouter."""
+    def __init__(self, router, name, fallback):
+        self.router = router
+        self.name = name
+        self.fallback = fallback
+
+    @property
+    def encoding(self):
+        return getattr(self.fallback, "encoding", None) or "utf-8"
+
+    @property
+    def errors(self):
+        return getattr(self.fallback, "errors", None) or "replace"
+
+    def write(self, text):
+        if not self.router.put(self.name, text) and self.fallback is not None:
+            self.fallback.write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.router.routes(get_ident()):
+            self.router.requestFlush()
+        elif self.fallback is not None:
+            self.fallback.flush()
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        raise io.UnsupportedOperation("%s is redirected to the console" % self.name)
+
+
+class OutputRouter(QtCore.QObject):
+    """Routes stdout/stderr writes of the console's threads into the output pane.
+
+    Once installed the router stays in sys.stdout/sys.stderr.  Writes from
+    threads the console owns are tagged with the stream, the thread, the
+    execution that owns the thread and a timestamp and pushed onto a deque,
+    which needs no lock, and the GUI thread drains it in batches every
+    `interval` milliseconds.  Code running on the GUI thread blocks that
+    timer, so its own writes flush the queue, again at most once every
+    `interval` milliseconds.  Batches are emitted as lists of
+    (stream, execution, timestamp, text) chunks.  Writes from any other
+    thread go to the stream that was installed before.
+
+    While `capture` is active the calling thread, which may be a worker
+    thread, and every thread started during it are owned by the console;
+    threads started by executed code stay routed after the execution has
+    finished, until they exit.
+
+    To keep a runaway print loop from swamping the GUI thread, runs of at
+    least `collapse_min` identical non-empty lines are collapsed into
+    "line (xN)", and at most `max_rate` characters per second are handed to
+    the output pane: every batch may send what the time since the previous
+    one allows plus what earlier batches left unused, up to one second's
+    worth.  Output over the rate is held back for the following batches,
+    cut within a line if it has to be, and producers stop queueing once
+    `max_pending` characters are waiting.  Whatever gets dropped is
+    replaced by a marker and counted in `dropped_chars`, collapsed lines
+    are counted in `collapsed_lines`.
+    """
+    written = QtCore.Signal(object)
+    statsChanged = QtCore.Signal()
+    _wake = QtCore.Signal()
+    _finish = QtCore.Signal()
+
+    def __init__(self, parent=None, interval=50, pump_events=True,
+                 max_rate=2 * 1024 * 1024, max_pending=16 * 1024 * 1024, collapse_hold=0.2, collapse_min=3):
+        super(OutputRouter, self).__init__(parent)
+        self.interval = interval
+        self.pump_events = pump_events
+        self.max_rate = max_rate
+        self._tokens = float(max_rate)
+        self.max_pending = max_pending
+        self.collapse_hold = collapse_hold
+        self.collapse_min = collapse_min
+        self.collapsed_lines = 0
+        self.dropped_chars = 0
+        self._overflow = 0
+        self._held = None
+        self._backlog = []
+        self._backlogged = 0
+        self._collapsed = 0
+        self.stdout = None
+        self.stderr = None
+        self._installed = False
+        self._queue = collections.deque()
+        self._routes = {}
+        self._known = None
+        self.execution = 0
+        self._partial = {}
+        self._buffered = 0
+        self._last_flush = time.time()
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._drain)
+        self._wake.connect(self._timer.start)
+        self._finish.connect(self._flushFinal)
+
+    def install(self):
+        if self._installed:
+            return
+        self.stdout = RoutedStream(self, "stdout", sys.stdout)
+        self.stderr = RoutedStream(self, "stderr", sys.stderr)
+        sys.stdout = self.stdout
+        sys.stderr = self.stderr
+        self._installed = True
+
+    def uninstall(self):
+        if not self._installed:
+            return
+        # Someone may have installed over us, in which case they keep
+        # forwarding to our fallbacks.
+        if sys.stdout is self.stdout:
+            sys.stdout = self.stdout.fallback
+        if sys.stderr is self.stderr:
+            sys.stderr = self.stderr.fallback
+        self._installed = False
+
+    def routes(self, ident):
+        known = self._known
+        return ident in self._routes or (known is not None and ident not in known)
+
+    def put(self, name, text):
+        """Queue text written by the current thread, returns False if the thread isn't routed."""
+        ident = get_ident()
+        if not self._installed or not self.routes(ident):
+            return False
+        if not text:
+            return True
+        execution = self._routes.setdefault(ident, self.execution)
+        if self._buffered + self._backlogged >= self.max_pending:
+            # The output pane can't keep up, drop rather than block.
+            self._overflow += len(text)
+        else:
+            self._queue.append((name, ident, execution, time.time(), text))
+            self._buffered += len(text)
+        if QtCore.QThread.currentThread() == self.thread():
+            elapsed = (time.time() - self._last_flush) * 1000
+            if elapsed >= self.interval:
+                self.flush()
+        return True
+
+    def push(self, name, text):
+        """Queue text from a thread that reads output on the console's behalf."""
+        ident = get_ident()
+        execution = self._routes.setdefault(ident, self.execution)
+        if self._buffered + self._backlogged >= self.max_pending:
+            self._overflow += len(text)
+        else:
+            self._queue.append((name, ident, execution, time.time(), text))
+            self._buffered += len(text)
+        if not self._timer.isActive():
+            self._wake.emit()
+
+    def forward(self, name, text):
+        """Queue text produced outside this process for the current execution."""
+        if self._buffered + self._backlogged >= self.max_pending:
+            self._overflow += len(text)
+        else:
+            self._queue.append((name, get_ident(), self.execution, time.time(), text))
+            self._buffered += len(text)
+        if not self._timer.isActive():
+            self._wake.emit()
+
+    def beginExecution(self):
+        """Start a new execution for output that isn't captured from this process."""
+        self.execution += 1
+        self._timer.start()
+        return self.execution
+
+    def message(self, text, name="stderr"):
+        """Queue text for the output pane without routing the calling thread."""
+        self._queue.append((name, get_ident(), self.execution, time.time(), text))
+        if QtCore.QThread.currentThread() == self.thread():
+            self._timer.start()
+        else:
+            self._wake.emit()
+
+    @contextlib.contextmanager
+    def capture(self):
+        self.install()
+        ident = get_ident()
+        owner = self._routes.get(ident)
+        self.execution += 1
+        self._known = set(thread.ident for thread in threading.enumerate())
+        self._known.discard(ident)
+        self._routes[ident] = self.execution
+        gui_thread = QtCore.QThread.currentThread() == self.thread()
+        if gui_thread:
+            self._timer.start()
+        else:
+            self._wake.emit()
+        try:
+            yield self
+        finally:
+            for thread in threading.enumerate():
+                if thread.ident not in self._known:
+                    self._routes.setdefault(thread.ident, self.execution)
+            self._known = None
+            if owner is None:
+                self._routes.pop(ident, None)
+            else:
+                self._routes[ident] = owner
+            # The queue is only ever drained on the GUI thread.
+            if gui_thread:
+                self.flush(final=True)
+            else:
+                self._finish.emit()
+
+    @contextlib.contextmanager
+    def routed(self):
+        """Route the current thread to the latest execution without starting a new one."""
+        self.install()
+        ident = get_ident()
+        if ident in self._routes:
+            yield self
+            return
+        self._routes[ident] = self.execution
+        try:
+            yield self
+        finally:
+            self._routes.pop(ident, None)
+            if QtCore.QThread.currentThread() == self.thread():
+                self._timer.start()
+            else:
+                self._wake.emit()
+
+    def _flushFinal(self):
+        self.flush(final=True)
+
+    def requestFlush(self):
+        # Other threads are picked up by the next drain, and the GUI thread
+        # flushes no more often than `put` does.
+        if QtCore.QThread.currentThread() != self.thread():
+            return
+        if (time.time() - self._last_flush) * 1000 >= self.interval:
+            self.flush()
+
+    def _drain(self):
+        self.flush()
+        idle = not self._queue and not self._partial and self._held is None and not self._backlog
+        if self._known is None and idle:
+            alive = set(thread.ident for thread in threading.enumerate())
+            for ident in list(self._routes):
+                if ident not in alive:
+                    self._routes.pop(ident, None)
+            if not self._routes:
+                self._timer.stop()
+
+    def flush(self, final=False):
+        chunks = []
+        popleft = self._queue.popleft
+        while True:
+            try:
+                chunks.append(popleft())
+            except IndexError:
+                break
+        now = time.time()
+        elapsed = now - self._last_flush
+        chunks = self._assemble(chunks, final)
+        chunks = self._collapse(chunks, final, now)
+        chunks = self._limit(chunks, elapsed, now)
+        self._buffered = 0
+        # Held back output still counts against max_pending.
+        self._backlogged = sum(len(chunk[3]) for chunk in self._backlog)
+        self._last_flush = now
+        if not chunks:
+            return
+        self.written.emit(chunks)
+        if self.pump_events and QtCore.QThread.currentThread() == self.thread():
+            # Code running on the GUI thread blocks the event loop, let the
+            # output pane repaint without handing it user input.
+            QtCore.QCoreApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
+
+    def _assemble(self, chunks, final):
+        # Keep each thread's unfinished line back for one batch so lines
+        # printed concurrently by several threads don't get spliced together.
+        partial = self._partial
+        seen = set()
+        out = []
+        for name, ident, execution, timestamp, text in chunks:
+            seen.add(ident)
+            text = text.replace("\0", "")
+            held = partial.pop(ident, None)
+            if held is not None:
+                if held[0] == name:
+                    text = held[3] + text
+                    timestamp = held[2]
+                else:
+                    out.append(held)
+            head, sep, tail = text.rpartition("\n")
+            if sep:
+                out.append((name, execution, timestamp, head + sep))
+            if tail:
+                partial[ident] = (name, execution, timestamp, tail)
+        for ident in list(partial):
+            if final or ident not in seen:
+                out.append(partial.pop(ident))
+        return out
+
+    def _collapse(self, chunks, final, now):
+        # The newest complete line is held back until a different line shows
+        # up, `collapse_hold` seconds have passed or the execution finished.
+        held = self._held
+        lines = []
+        for name, execution, timestamp, text in chunks:
+            pieces = text.split("\n")
+            tail = pieces.pop()
+            for line in pieces:
+                if held is not None and held[3] == line and held[0] == name:
+                    held[4] += 1
+                    continue
+                if held is not None:
+                    lines.append(self._release(held))
+                    held = None
+                if not line.strip():
+                    # Blank lines are layout, never collapse them.
+                    lines.append((name, execution, timestamp, line + "\n"))
+                    continue
+                held = [name, execution, timestamp, line, 1]
+            if tail:
+                if held is not None:
+                    lines.append(self._release(held))
+                    held = None
+                lines.append((name, execution, timestamp, tail))
+        if held is not None and (final or now - held[2] >= self.collapse_hold):
+            lines.append(self._release(held))
+            held = None
+        self._held = held
+
+        out = []
+        for name, execution, timestamp, text in lines:
+            if out and out[-1][0] == name and out[-1][1] == execution:
+                out[-1][3].append(text)
+            else:
+                out.append((name, execution, timestamp, [text]))
+        return [(name, execution, timestamp, "".join(texts)) for name, execution, timestamp, texts in out]
+
+    def _release(self, held):
+        name, execution, timestamp, line, count = held
+        if count >= self.collapse_min:
+            self.collapsed_lines += count - 1
+            return name, execution, timestamp, "%s (x%d)\n" % (line, count)
+        return name, execution, timestamp, (line + "\n") * count
+
+    def _limit(self, chunks, elapsed, now):
+        # A token bucket: unused allowance carries over, up to one second.
+        self._tokens = min(self._tokens + self.max_rate * max(elapsed, 0.0), float(self.max_rate))
+        allowance = int(self._tokens)
+        dropped = self._overflow
+        self._overflow = 0
+        out = []
+        backlog = []
+        for chunk in self._backlog + chunks:
+            name, execution, timestamp, text = chunk
+            if backlog or not allowance:
+                backlog.append(chunk)
+                continue
+            if len(text) <= allowance:
+                out.append(chunk)
+                allowance -= len(text)
+                continue
+            # Send what fits, ending on a line break when there is one, and
+            # hold the rest back for the next batches.
+            cut = text.rfind("\n", 0, allowance) + 1 or allowance
+            out.append((name, execution, timestamp, text[:cut]))
+            backlog.append((name, execution, timestamp, text[cut:]))
+            allowance = 0
+        self._backlog = backlog
+        self._tokens -= sum(len(chunk[3]) for chunk in out)
+        if dropped:
+            self.dropped_chars += dropped
+            execution = out[-1][1] if out else self.execution
+            out.append(("stderr", execution, now, "[... %d characters of output dropped ...]\n" % dropped))
+        if dropped or self._collapsed != self.collapsed_lines:
+            self._collapsed = self.collapsed_lines
+            self.statsChanged.emit()
+        return out
+
+    def resetStats(self):
+        self.collapsed_lines = 0
+        self.dropped_chars = 0
+        self._collapsed = 0
+        self.statsChanged.emit()
+
+
+def _flush_c_streams():
+    try:
+        if sys.platform == "win32":
+            ctypes.cdll.msvcrt.fflush(None)
+        else:
+            ctypes.CDLL(None).fflush(None)
+    except (AttributeError, OSError):
+        pass
+
+
+class FDCapture(QtCore.QObject):
+    """Redirects file descriptors 1 and 2 into the router.
+
+    Output written by C/C++ code straight to the descriptors never passes
+    through sys.stdout, so each descriptor is pointed at a pipe with
+    os.dup2 and a reader thread pushes whatever arrives on it into the
+    router's queue.  The original descriptors are restored by `stop`.
+    """
+    def __init__(self, router, parent=None, interval=50):
+        super(FDCapture, self).__init__(parent)
+        self.router = router
+        self._saved = {}
+        self._threads = []
+        # C stdio buffers a pipe fully, flush it regularly so output
+        # shows up while the code is still running.
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(_flush_c_streams)
+
+    @property
+    def active(self):
+        return bool(self._saved)
+
+    def start(self):
+        if self.active:
+            return
+        self.router.install()
+        self._flush()
+        try:
+            for fd, name in ((1, "stdout"), (2, "stderr")):
+                read_fd, write_fd = os.pipe()
+                self._saved[fd] = os.dup(fd)
+                os.dup2(write_fd, fd)
+                os.close(write_fd)
+                thread = threading.Thread(
+                    target=self._read,
+                    args=(read_fd, name),
+                    name="QtPythonConsole-fd%d" % fd
+                )
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        except OSError:
+            self.stop()
+            raise
+        self._timer.start()
+
+    def stop(self):
+        if not self.active:
+            return
+        self._timer.stop()
+        self._flush()
+        # Restoring the descriptor closes the last write end of the pipe,
+        # which ends the reader thread.
+        for fd, saved in self._saved.items():
+            os.dup2(saved, fd)
+            os.close(saved)
+        self._saved = {}
+        for thread in self._threads:
+            thread.join(1.0)
+        self._threads = []
+
+    def _flush(self):
+        for stream in (sys.__stdout__, sys.__stderr__):
+            if stream is not None:
+                stream.flush()
+        _flush_c_streams()
+
+    def _read(self, fd, name):
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        try:
+            while True:
+                data = os.read(fd, 65536)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    self.router.push(name, text)
+        finally:
+            os.close(fd)
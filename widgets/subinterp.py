@@ -0,0 +1,190 @@
+"""Console sessions backed by a sub-interpreter.
+
+Each session owns an isolated interpreter with its own GIL, so several
+consoles can run CPU-bound code in parallel inside the host process.  It
+has the same interface as `KernelClient`, minus `fetch`: objects can't be
+shared between interpreters.  Sub-interpreters need the
+`concurrent.interpreters` module from Python 3.14, check `available()`
+before using one.
+
+Code inside a sub-interpreter can't be interrupted from the outside, and
+only extension modules that support multiple interpreters import there.
+"""
+import threading
+
+from .background import package_root, start_thread
+
+try:
+    from concurrent import interpreters
+except ImportError:
+    interpreters = None
+
+
+# Runs once in every new interpreter.  Output and completion go back over
+# the queue as strings with a one character tag, strings can be shared
+# between interpreters on every version.
+_BOOTSTRAP = """
+import asyncio
+import importlib
+import sys
+import traceback
+
+sys.path.insert(0, package_root)
+_cache = importlib.import_module(package + ".compiler").CodeCache()
+_run_async = importlib.import_module(package + ".coroutines").run_async
+_namespace = {"__name__": "__main__"}
+_loop = asyncio.new_event_loop()
+
+
+class _Writer(object):
+    def __init__(self, tag):
+        self.tag = tag
+
+    def write(self, text):
+        if text:
+            queue.put(self.tag + text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+sys.stdout = _Writer("o")
+sys.stderr = _Writer("e")
+
+
+def _console_run(source):
+    error = ""
+    try:
+        snippet = _cache.compile(source)
+        if snippet.is_async:
+            result = _loop.run_until_complete(_run_async(snippet, _namespace))
+        else:
+            result = snippet.run(_namespace)
+        if result is not None:
+            _namespace["_"] = result
+            print(result)
+    except BaseException as err:
+        traceback.print_exc()
+        error = "".join(traceback.format_exception_only(type(err), err)).strip()
+    queue.put("d" + error)
+"""
+
+
+def available():
+    return interpreters is not None
+
+
+class SubInterpreterSession(object):
+    """Runs code in a sub-interpreter on a worker thread.
+
+    `on_output(stream, text)` and `on_done(request, error)` are called from
+    a background thread, like the callbacks of `KernelClient`.
+    """
+    def __init__(self, on_output, on_done):
+        self.on_output = on_output
+        self.on_done = on_done
+        self.interpreter = None
+        self.queue = None
+        self.request = None
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._executing = False
+        self._closing = False
+
+    @property
+    def alive(self):
+        return self.interpreter is not None
+
+    @property
+    def busy(self):
+        return self.request is not None
+
+    def start(self):
+        if self.interpreter is not None:
+            return
+        if interpreters is None:
+            raise RuntimeError("Sub-interpreters need Python 3.14 or newer")
+        self._closing = False
+        self.queue = interpreters.create_queue()
+        self.interpreter = interpreters.create()
+        self.interpreter.prepare_main(
+            queue=self.queue,
+            package_root=package_root(),
+            package=__name__.rsplit(".", 1)[0],
+        )
+        try:
+            self.interpreter.exec(_BOOTSTRAP)
+        except interpreters.ExecutionFailed:
+            self.interpreter.close()
+            self.interpreter = None
+            raise
+        start_thread("QtPythonConsole-subinterpreter", self._read, self.queue)
+
+    def execute(self, source):
+        with self._lock:
+            if self.busy:
+                raise RuntimeError("The sub-interpreter is still running code")
+            self.start()
+            self._counter += 1
+            self.request = self._counter
+            self._executing = True
+            start_thread("QtPythonConsole-subinterpreter", self._run, self.interpreter, self.queue, source)
+            return self.request
+
+    def _run(self, interpreter, queue, source):
+        try:
+            interpreter.exec("_console_run(%r)" % (source,))
+        except interpreters.ExecutionFailed as err:
+            queue.put("d%s" % err)
+        with self._lock:
+            self._executing = False
+            if self._closing:
+                self._close()
+
+    def _read(self, queue):
+        while True:
+            item = queue.get()
+            tag, text = item[0], item[1:]
+            if tag == "q":
+                break
+            if tag == "d":
+                request, self.request = self.request, None
+                self.on_done(request, text or None)
+            else:
+                self.on_output("stdout" if tag == "o" else "stderr", text)
+
+    def interrupt(self):
+        return False
+
+    def restart(self):
+        self.kill()
+        self.start()
+
+    def shutdown(self):
+        """Close the interpreter once the running code is done, right away if it's idle.
+
+        Meant for when the console goes away, nothing is reported any more.
+        """
+        self.on_output = self.on_done = lambda *args: None
+        with self._lock:
+            if self._executing:
+                self._closing = True
+            else:
+                self._close()
+
+    def kill(self):
+        if self.busy:
+            raise RuntimeError("A running sub-interpreter can't be closed")
+        self._close()
+
+    def _close(self):
+        if self.interpreter is None:
+            return
+        self.queue.put("q")
+        self.interpreter.close()
+        self.interpreter = None
+        self.queue = None
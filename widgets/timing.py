@@ -0,0 +1,92 @@
+import math
+import os
+import re
+import timeit
+
+import six
+
+_OPTION = re.compile(r"^-([nr])\s*(\d+)\s*")
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), (u"\u00b5s", 1e-6)):
+        if seconds >= scale:
+            return "%.3g %s" % (seconds / scale, unit)
+    return "%.3g ns" % (seconds / 1e-9)
+
+
+def parse_timeit(arguments):
+    """Split `-n <loops> -r <runs>` off the front of the %timeit arguments."""
+    options = {"n": 0, "r": 7}
+    match = _OPTION.match(arguments)
+    while match is not None:
+        options[match.group(1)] = int(match.group(2))
+        arguments = arguments[match.end():]
+        match = _OPTION.match(arguments)
+    return options["n"], options["r"], arguments
+
+
+def time_run(snippet, namespace):
+    """Run a compiled snippet once and print its CPU and wall time."""
+    times = os.times()
+    start = timeit.default_timer()
+    try:
+        return snippet.run(namespace)
+    finally:
+        wall = timeit.default_timer() - start
+        end = os.times()
+        user, system = end[0] - times[0], end[1] - times[1]
+        print("CPU times: user %s, sys %s, total %s" % (
+            format_time(user), format_time(system), format_time(user + system)
+        ))
+        print("Wall time: %s" % format_time(wall))
+
+
+def _timer(code, namespace):
+    try:
+        return timeit.Timer(code, globals=namespace)
+    except TypeError:
+        return _function_timer(code, namespace)
+
+
+def _function_timer(code, namespace):
+    # Before Python 3.5 a Timer runs its code in a namespace of its own, so
+    # time a function defined in `namespace` instead; the call adds a
+    # little to every loop.
+    source = "def __timeit_inner():\n" + "".join("    %s\n" % line for line in code.splitlines() or ["pass"])
+    scope = {}
+    six.exec_(compile(source, "<timeit>", "exec"), namespace, scope)
+    return timeit.Timer(scope["__timeit_inner"])
+
+
+def _autorange(timer):
+    # Timer.autorange is new in Python 3.6.
+    if hasattr(timer, "autorange"):
+        return timer.autorange()[0]
+    number = 1
+    while True:
+        for loops in (number, number * 2, number * 5):
+            if timer.timeit(loops) >= 0.2:
+                return loops
+        number *= 10
+
+
+def time_repeated(code, namespace, number=0, repeat=7):
+    """Time `code` like %timeit and print best, mean and standard deviation per loop.
+
+    The code is compiled once, into the loop of a timeit.Timer, and runs
+    with `namespace` as its globals; names it assigns stay local to the
+    timing loop.  With `number` 0 the loop count is raised until one run
+    takes at least 0.2 seconds.
+    """
+    timer = _timer(code, namespace)
+    if not number:
+        number = _autorange(timer)
+    runs = [total / number for total in timer.repeat(repeat=max(repeat, 1), number=number)]
+    mean = sum(runs) / len(runs)
+    stdev = math.sqrt(sum((run - mean) ** 2 for run in runs) / (len(runs) - 1)) if len(runs) > 1 else 0.0
+    print(u"best %s, mean %s \u00b1 %s per loop (%d runs, %d loop%s each)" % (
+        format_time(min(runs)), format_time(mean), format_time(stdev),
+        len(runs), number, "" if number == 1 else "s",
+    ))
+    return runs